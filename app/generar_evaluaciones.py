@@ -0,0 +1,236 @@
+"""
+Genera evaluaciones sin la interfaz web, a partir de una carpeta de clases en PDF.
+
+Uso:
+    python app/generar_evaluaciones.py clases/ spec.json salida/ --workers 4
+
+El archivo de especificación es un JSON con los mismos parámetros de la
+página "Crea tu evaluación":
+
+    {
+        "topic": "Biología celular",
+        "question_type": "Alternativas",
+        "num_questions": 10,
+        "difficulty": "Intermedio",
+        "comments": "",
+        "sample_questions": "pruebas/prueba_2023.pdf",
+        "files": {"clase_03.pdf": {"topic": "Mitocondria"}}
+    }
+
+Si "question_type" es "Mixta", se usa "question_counts" con la cantidad de
+preguntas por tipo. "files" permite cambiar parámetros para un archivo en
+particular y, si no se indica "topic", se usa el nombre del archivo. La
+ruta de "sample_questions" es relativa al archivo de especificación.
+
+Por cada PDF se escriben <nombre>.json, <nombre>.pdf y
+<nombre> sin respuestas.pdf. Si el proceso se interrumpe, al volver a
+ejecutarlo se saltan los archivos cuyo JSON ya existe y corresponde al
+mismo PDF.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from streamlit.logger import set_log_level
+
+from utils.llm_clients import get_chat_model
+from utils.pdf_utils import extract_text_from_pdf, get_file_digest, render_test_pdfs
+from utils.question_generation import (
+    QUESTION_TYPES,
+    bibliography_input,
+    generate_mixed_questions,
+    generate_questions,
+    question_type_name,
+    shard_sizes,
+)
+from utils.retrieval import build_index, focus_hints
+
+logger = logging.getLogger("generar_evaluaciones")
+
+
+def load_spec(path: Path) -> dict:
+    """
+    Lee y valida el archivo de especificación.
+    """
+    with open(path, encoding="utf-8") as spec_file:
+        spec = json.load(spec_file)
+
+    question_type = spec.setdefault("question_type", "Alternativas")
+    if question_type == "Mixta":
+        counts = spec.get("question_counts", {})
+        unknown = set(counts) - set(QUESTION_TYPES)
+        if unknown or not sum(counts.values()):
+            raise ValueError(
+                "question_counts debe indicar cuántas preguntas generar de "
+                f"{', '.join(QUESTION_TYPES)}"
+            )
+    elif question_type not in QUESTION_TYPES:
+        raise ValueError(f"Tipo de pregunta desconocido: {question_type}")
+    spec.setdefault("num_questions", 10)
+    spec.setdefault("difficulty", "Intermedio")
+    spec.setdefault("comments", "")
+    spec.setdefault("files", {})
+    return spec
+
+
+def is_done(json_path: Path, digest: str) -> bool:
+    """
+    Indica si un PDF ya fue procesado en una ejecución anterior.
+    """
+    try:
+        with open(json_path, encoding="utf-8") as json_file:
+            return json.load(json_file).get("source_digest") == digest
+    except (OSError, ValueError):
+        return False
+
+
+def write_atomic(path: Path, content: bytes):
+    """
+    Escribe un archivo completo o no lo escribe, para poder reanudar.
+    """
+    temporary_path = path.with_name(path.name + ".tmp")
+    with open(temporary_path, "wb") as output:
+        output.write(content)
+    os.replace(temporary_path, path)
+
+
+def process_pdf(
+    pdf_path: Path, spec: dict, sample_questions_text: str, output_dir: Path
+):
+    """
+    Genera la evaluación de una clase y guarda el JSON y los dos PDFs.
+
+    Returns:
+        str: "omitido" si ya estaba generado, o "generado".
+    """
+    params = {**spec, **spec["files"].get(pdf_path.name, {})}
+    topic = params.get("topic") or pdf_path.stem
+    json_path = output_dir / f"{pdf_path.stem}.json"
+
+    with open(pdf_path, "rb") as pdf_file:
+        digest = get_file_digest(pdf_file)
+        if is_done(json_path, digest):
+            return "omitido"
+        bibliography_text = extract_text_from_pdf(pdf_file)
+
+    question_type = params["question_type"]
+    context_types = (
+        list(QUESTION_TYPES) if question_type == "Mixta" else [question_type]
+    )
+    bibliography_index = build_index(bibliography_text)
+    query = " ".join([topic, params["comments"]] + context_types)
+    counts = (
+        params["question_counts"]
+        if question_type == "Mixta"
+        else {question_type: params["num_questions"]}
+    )
+    hints = focus_hints(
+        bibliography_index,
+        query,
+        max(len(shard_sizes(count)) for count in counts.values()),
+    )
+    prompt_input = {
+        **bibliography_input(bibliography_index, query),
+        "sample_questions": sample_questions_text,
+        "question_quantity": params["num_questions"],
+        "difficulty": params["difficulty"],
+        "topic": topic,
+    }
+
+    llm = get_chat_model(temperature=1)
+    if question_type == "Mixta":
+        questions, errors = generate_mixed_questions(
+            llm,
+            params["question_counts"],
+            prompt_input,
+            params["comments"],
+            focus_hints=hints,
+        )
+        if errors:
+            raise RuntimeError(
+                "; ".join(f"{failed_type}: {e}" for failed_type, e in errors)
+            )
+    else:
+        questions = generate_questions(
+            llm, question_type, prompt_input, params["comments"], focus_hints=hints
+        )
+
+    pdf_with_answers, pdf_without_answers = render_test_pdfs(questions, topic)
+    write_atomic(output_dir / f"{pdf_path.stem}.pdf", pdf_with_answers)
+    write_atomic(
+        output_dir / f"{pdf_path.stem} sin respuestas.pdf", pdf_without_answers
+    )
+
+    # El JSON se escribe al final y marca el archivo como terminado
+    result = {
+        "source": pdf_path.name,
+        "source_digest": digest,
+        "topic": topic,
+        "difficulty": params["difficulty"],
+        "questions": [
+            {"tipo": question_type_name(question), **question.model_dump()}
+            for question in questions
+        ],
+    }
+    write_atomic(
+        json_path, json.dumps(result, ensure_ascii=False, indent=2).encode("utf-8")
+    )
+    return "generado"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("input_dir", type=Path, help="Carpeta con las clases en PDF.")
+    parser.add_argument("spec", type=Path, help="Archivo JSON con la especificación.")
+    parser.add_argument("output_dir", type=Path, help="Carpeta de salida.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Cantidad de clases procesadas en paralelo.",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    set_log_level("error")
+
+    spec = load_spec(args.spec)
+    sample_questions_text = ""
+    if spec.get("sample_questions"):
+        with open(args.spec.parent / spec["sample_questions"], "rb") as pdf_file:
+            sample_questions_text = extract_text_from_pdf(pdf_file)
+
+    pdf_paths = sorted(args.input_dir.glob("*.pdf"))
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    logger.info("Procesando %d clases con %d workers", len(pdf_paths), args.workers)
+
+    failed = 0
+    executor = ThreadPoolExecutor(max_workers=args.workers)
+    try:
+        futures = {
+            executor.submit(
+                process_pdf, pdf_path, spec, sample_questions_text, args.output_dir
+            ): pdf_path
+            for pdf_path in pdf_paths
+        }
+        for future in as_completed(futures):
+            try:
+                logger.info("%s: %s", futures[future].name, future.result())
+            except Exception as e:
+                failed += 1
+                logger.error("%s: error, %s", futures[future].name, e)
+    except KeyboardInterrupt:
+        logger.warning("Interrumpido. Vuelve a ejecutar el comando para reanudar.")
+        executor.shutdown(wait=False, cancel_futures=True)
+        sys.exit(130)
+    executor.shutdown()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
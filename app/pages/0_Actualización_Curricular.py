@@ -1,9 +1,29 @@
 import streamlit as st
 import markdown
 import io
+import time
 from xhtml2pdf import pisa
-from langchain_openai import ChatOpenAI
-import PyPDF2
+from utils.curriculum import (
+    CURRICULUM_SINGLE_PROMPT_TOKENS,
+    analyze_sections,
+    build_plan_prompt,
+    split_program_sections,
+)
+from utils.jobs import (
+    FAILED,
+    JOB_POLL_SECONDS,
+    JobQueueFullError,
+    get_job_queue,
+    job_key,
+    report_progress,
+)
+from utils.llm_cache import stream_cached
+from utils.llm_clients import get_chat_model
+from utils.metrics import span
+from utils.pdf_extraction import PdfLimitError
+from utils.pdf_utils import extract_text_from_pdf
+from utils.retrieval import estimate_tokens
+from utils.session_store import get_session_id
 
 # Configuración de la página
 st.set_page_config(
@@ -11,32 +31,18 @@ st.set_page_config(
     page_icon="📚",
 )
 
-# Cargar variables de entorno
-OPENAI_API_KEY = st.secrets["OPENAI_API_KEY"]
-
-# Inicializar LLM
-llm = ChatOpenAI(openai_api_key=OPENAI_API_KEY, model="gpt-4o-mini")
-
-
-# Función para leer archivos PDF
-def read_pdf(file):
-    pdf_reader = PyPDF2.PdfReader(file)
-    text = ""
-    for page_num in range(len(pdf_reader.pages)):
-        text += pdf_reader.pages[page_num].extract_text()
-    return text
-
-
-# Función para crear un prompt más estructurado
+# Función para crear un prompt más estructurado. El programa del curso va
+# primero, para que el proveedor reutilice ese prefijo desde su caché al
+# cambiar solo la materia o los comentarios
 def generar_prompt(programa_curso, comentarios_profesor, materia):
     prompt = f"""
-    Eres un profesor experto en planificar y actualizar programas de estudios en {materia}.
-    A continuación te doy el programa actual del curso y comentarios del profesor:
-    
+    Eres un profesor experto en planificar y actualizar programas de estudios.
+    A continuación te doy el programa actual del curso:
+
     Programa del curso:
     {programa_curso}
 
-    Comentarios del profesor:
+    El curso es de {materia}. Estos son los comentarios del profesor:
     {comentarios_profesor}
 
     Con base en esto, sugiéreme una actualización del curso, incluyendo:
@@ -58,11 +64,76 @@ def convert_markdown_to_html(markdown_text):
 # Función para convertir HTML a PDF y retornar un archivo en memoria
 def convert_html_to_pdf_memory(source_html):
     pdf_output = io.BytesIO()
-    pisa_status = pisa.CreatePDF(io.StringIO(source_html), dest=pdf_output)
+    with span("pdf_rendering"):
+        pisa_status = pisa.CreatePDF(io.StringIO(source_html), dest=pdf_output)
     pdf_output.seek(0)
     return pdf_output if not pisa_status.err else None
 
 
+# Función para crear el prompt de la planificación. Los programas largos se
+# analizan primero por secciones en paralelo y el prompt final solo lleva
+# esas notas, así ninguna llamada recibe el programa completo. Devuelve
+# también la cantidad de secciones que no se pudieron analizar
+def preparar_prompt(llm, programa_curso, comentarios_profesor, materia):
+    if estimate_tokens(programa_curso) <= CURRICULUM_SINGLE_PROMPT_TOKENS:
+        return generar_prompt(programa_curso, comentarios_profesor, materia), 0
+
+    secciones = split_program_sections(programa_curso)
+    report_progress(f"Analizando las {len(secciones)} secciones del programa...")
+    notas = analyze_sections(
+        llm,
+        secciones,
+        comentarios_profesor,
+        materia,
+        on_progress=lambda listas, total: report_progress(
+            f"Analizadas {listas} de {total} secciones del programa..."
+        ),
+    )
+    fallidas = sum(nota is None for nota in notas)
+    return build_plan_prompt(notas, comentarios_profesor, materia), fallidas
+
+
+# Función para generar la planificación en segundo plano. El texto parcial
+# se publica en el trabajo para mostrarlo mientras el modelo responde, a lo
+# más una vez por cada revisión de la página, para no unir los fragmentos
+# recibidos con cada uno que llega
+def generar_planificacion(llm, programa_curso, comentarios_profesor, materia):
+    with span("curriculum_planning"):
+        prompt, secciones_fallidas = preparar_prompt(
+            llm, programa_curso, comentarios_profesor, materia
+        )
+        fragmentos = []
+        publicado = time.monotonic()
+        for chunk in stream_cached(llm, prompt):
+            fragmentos.append(chunk)
+            if time.monotonic() - publicado >= JOB_POLL_SECONDS:
+                report_progress("".join(fragmentos))
+                publicado = time.monotonic()
+        planificacion = "".join(fragmentos)
+
+        # Convertir la respuesta a HTML una vez terminada
+        html_content = convert_markdown_to_html(planificacion)
+
+        # Generar el PDF desde HTML en memoria
+        pdf_output = convert_html_to_pdf_memory(html_content)
+    return (
+        planificacion,
+        pdf_output.getvalue() if pdf_output else None,
+        secciones_fallidas,
+    )
+
+
+# Avance de la planificación en curso. Al terminar se vuelve a ejecutar la
+# página para mostrar el resultado
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def mostrar_avance(key):
+    job = get_job_queue().get(key)
+    if job is None or job.finished:
+        st.rerun()
+    st.markdown("### Planificación sugerida:")
+    st.markdown(job.progress or "Generando la planificación...")
+
+
 # Interfaz de Streamlit
 st.markdown("# Herramienta de Actualización Curricular")
 
@@ -75,42 +146,80 @@ comentarios_profesor = st.text_area(
     "Ingresa ideas o comentarios sobre los cambios que deseas realizar en el curso:"
 )
 
+nueva_planificacion = st.checkbox(
+    "Generar una planificación nueva",
+    help="Ignora las planificaciones ya generadas con los mismos datos.",
+)
+llm = get_chat_model(use_cache=not nueva_planificacion)
+
 # Leer archivo PDF
 program_text = ""
 
 if uploaded_program:
-    program_text = read_pdf(uploaded_program)
-    st.success("Programa cargado correctamente.")
-
-# Generación del PDF
+    try:
+        program_text = extract_text_from_pdf(uploaded_program)
+        st.success("Programa cargado correctamente.")
+    except PdfLimitError as e:
+        st.error(f"No se pudo leer el programa. {e}")
+
+# Generación de la planificación. Se encola como un trabajo en segundo
+# plano, así otras interacciones con la página no la interrumpen ni la
+# repiten
 if st.button("Generar Planificación"):
     if program_text:
-        # Crear el prompt para el modelo
-        prompt = generar_prompt(program_text, comentarios_profesor, materia)
-
-        # Llamar al modelo con el prompt
-        response = llm(prompt)
-
-        # Convertir la respuesta a HTML
-        html_content = convert_markdown_to_html(response.content)
-
-        # Mostrar el resultado generado
-        st.markdown("### Planificación sugerida:")
-        st.write(response.content)
-
-        # Generar el PDF desde HTML en memoria
-        pdf_output = convert_html_to_pdf_memory(html_content)
-
-        if pdf_output:
-            # Botón para descargar el PDF
-            st.download_button(
-                label="Descargar Planificación en PDF",
-                data=pdf_output,
-                file_name="planificacion_actualizacion_curso.pdf",
-                mime="application/pdf",
+        key = job_key(
+            "curriculum",
+            get_session_id(),
+            program_text,
+            comentarios_profesor,
+            materia,
+            nueva_planificacion,
+        )
+        # Una planificación con otros datos reemplaza a la anterior, que se
+        # descarta para no gastar llamadas al modelo en ella
+        previous = st.session_state.get("curriculum_job")
+        if previous is not None and previous != key:
+            get_job_queue().cancel(previous)
+        try:
+            job = get_job_queue().submit(
+                key,
+                "curriculum_planning",
+                generar_planificacion,
+                llm,
+                program_text,
+                comentarios_profesor,
+                materia,
             )
-        else:
-            st.error("Error al generar el PDF.")
+            st.session_state.curriculum_job = job.key
+        except JobQueueFullError as e:
+            st.error(str(e))
 
     else:
         st.error("Por favor, sube el programa del curso.")
+
+# El resultado se mantiene al cambiar de página y volver
+job = get_job_queue().get(st.session_state.get("curriculum_job"))
+if job is not None and not job.finished:
+    mostrar_avance(job.key)
+elif job is not None and job.status == FAILED:
+    st.error(f"Error al generar la planificación: {job.error}")
+elif job is not None:
+    planificacion, pdf_output, secciones_fallidas = job.result
+    if secciones_fallidas:
+        st.warning(
+            f"No se pudieron analizar {secciones_fallidas} secciones del programa. "
+            "La planificación indica las partes que conviene revisar."
+        )
+    st.markdown("### Planificación sugerida:")
+    st.markdown(planificacion)
+
+    if pdf_output:
+        # Botón para descargar el PDF
+        st.download_button(
+            label="Descargar Planificación en PDF",
+            data=pdf_output,
+            file_name="planificacion_actualizacion_curso.pdf",
+            mime="application/pdf",
+        )
+    else:
+        st.error("Error al generar el PDF.")
@@ -1,15 +1,32 @@
+import uuid
 import streamlit as st
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
+from functools import partial
 from utils.pdf_utils import (
     extract_text_from_pdf,
-    convert_test_to_pdf,
-    convert_test_to_pdf_without_answers,
+    get_file_digest,
+    get_test_pdf,
 )
+from utils.jobs import (
+    FAILED,
+    JOB_POLL_SECONDS,
+    JobQueueFullError,
+    get_job_queue,
+    job_key,
+)
+from utils.llm_clients import get_chat_model
+from utils.pdf_extraction import PdfLimitError
+from utils.metrics import span
+from utils.question_bank import save_questions, search_questions
+from utils.question_generation import (
+    QUESTION_TYPES,
+    bibliography_input,
+    generate_mixed_questions,
+    generate_questions,
+    shard_sizes,
+)
+from utils.retrieval import BM25Index, build_index, focus_hints
+from utils.session_store import get_session, get_session_id, get_session_store
 from models.question import (
-    DevelopmentQuestionList,
-    MultipleChoiceQuestionList,
-    TrueFalseQuestionList,
     DevelopmentQuestion,
     MultipleChoiceQuestion,
     TrueFalseQuestion,
@@ -21,176 +38,63 @@ st.set_page_config(
     page_title="Generador de Evaluaciones", page_icon="📝", layout="wide"
 )
 
-# Inicializar estados para edición
-if "editing_question" not in st.session_state:
-    st.session_state.editing_question = None
-if "editing_answer" not in st.session_state:
-    st.session_state.editing_answer = None
-if "editing_alternatives" not in st.session_state:
-    st.session_state.editing_alternatives = None
-if "editing_section" not in st.session_state:
-    st.session_state.editing_section = None
-
-
-# Cargar variables de entorno y configurar el modelo
-@st.cache_resource
-def load_model():
-    api_key = st.secrets["OPENAI_API_KEY"]
-    model = ChatOpenAI(
-        openai_api_key=api_key,
-        model="gpt-4o-mini",
-        temperature=1,
-    )
-    return model
-
-
-llm = load_model()
-
-# Plantilla para el sistema
-system_template_message = """
-Eres un profesor experto en crear evaluaciones de la materia {topic}.
-
-Basado en tu conocimiento y en la bibliografía:
-{bibliography}
-
-en las siguientes preguntas realizadas anteriormente:
-{sample_questions}
-
-tienes que crear una evaluación según las especificaciones dadas
-por el profesor.
-
-"""
-
-comentarios_adicionales = """
-Considera estos comentarios adicionales al crear las preguntas:
-{comments}
-"""
-
-user_template_message = """
-Crea {question_quantity} preguntas de tipo {question_type}
-sobre el tema {topic} basandote en la bibliografía.
-Las preguntas deben tener dificultad {difficulty}.
-"""
-
-output_desarrollo_template = """
-Genera preguntas de desarrollo.
-El output debe ser un objeto JSON con la siguiente estructura:
-{{
-    "list_questions_answers": {{
-        "questions_answers": [
-            {{"pregunta": "¿Cuál es la capital de Francia?", "respuesta": "París"}},
-            {{"pregunta": "Explica el proceso de fotosíntesis", "respuesta": "La fotosíntesis es..."}}
-        ]
-    }}
-}}
-"""
-
-output_alternativas_template = """
-Genera preguntas de alternativas.
-El output debe ser un objeto JSON con la siguiente estructura:
-{{
-    "list_questions_answers": {{
-        "questions_answers": [
-            {{
-                "pregunta": "¿Cuál es la capital de Francia?",
-                "respuesta": "París",
-                "alternativas": ["París", "Londres", "Berlín", "Madrid", "Roma"]
-            }}
-        ]
-    }}
-}}
-"""
-
-output_verdadero_falso_template = """
-Genera preguntas de verdadero o falso.
-El output debe ser un objeto JSON con la siguiente estructura:
-{{
-    "list_questions_answers": {{
-        "questions_answers": [
-            {{"pregunta": "París es la capital de Francia", "respuesta": "Verdadero"}},
-            {{"pregunta": "Londres es la capital de Francia", "respuesta": "Falso"}}
-        ]
-    }}
-}}
-"""
-
-
-# Función extraer preguntas y respuestas
-def parse_question_jsons(
-    questions_answers_list: (
-        DevelopmentQuestionList | MultipleChoiceQuestionList | TrueFalseQuestionList
-    ),
-):
-    return questions_answers_list.questions_answers
+# Índice léxico de la bibliografía, reutilizado entre generaciones
+@st.cache_resource(max_entries=16)
+def load_bibliography_index(bibliography_text: str) -> BM25Index:
+    return build_index(bibliography_text)
 
 
-def toggle_edit_mode(question_idx, section):
-    collection = (
-        st.session_state.questions_selected
-        if section == "selected"
-        else st.session_state.questions_generated
-    )
-    question_answer: Union[
-        DevelopmentQuestion, MultipleChoiceQuestion, TrueFalseQuestion
-    ] = collection[question_idx]
-
-    if (
-        st.session_state.editing_question == question_idx
-        and st.session_state.editing_section == section
-    ):
-        st.session_state.editing_question = None
-        st.session_state.editing_answer = None
-        st.session_state.editing_alternatives = None
-        st.session_state.editing_section = None
-    else:
-        st.session_state.editing_question = question_idx
-        st.session_state.editing_answer = question_answer.respuesta
-        st.session_state.editing_section = section
-        if isinstance(question_answer, MultipleChoiceQuestion):
-            st.session_state.editing_alternatives = ", ".join(
-                question_answer.alternativas
-            )
+def new_question_ids(questions: list) -> dict:
+    """
+    Asigna un ID estable a cada pregunta, para seleccionarlas, eliminarlas y
+    editarlas sin buscarlas en las listas.
+    """
+    return {uuid.uuid4().hex: question for question in questions}
 
 
-def save_edits(question_idx, section):
-    collection = (
-        st.session_state.questions_selected
-        if section == "selected"
-        else st.session_state.questions_generated
+def get_question(question_id):
+    session = get_session()
+    return session.questions_selected.get(
+        question_id, session.questions_generated.get(question_id)
     )
-    question = collection[question_idx]
 
-    # Usar keys específicas para cada sección
+
+def toggle_edit_mode(question_id):
+    get_session().editing_questions ^= {question_id}
+
+
+def save_edits(question_id):
+    # La pregunta se modifica en su lugar, así los botones de descarga ya
+    # dibujados usan el contenido editado
+    question = get_question(question_id)
+    if question is None:
+        return
     question.pregunta = st.session_state.get(
-        f"edit_question_{section}_{question_idx}", question.pregunta
+        f"edit_question_{question_id}", question.pregunta
     )
     question.respuesta = st.session_state.get(
-        f"edit_answer_{section}_{question_idx}", question.respuesta
+        f"edit_answer_{question_id}", question.respuesta
     )
 
     if isinstance(question, MultipleChoiceQuestion):
         alternatives_text = st.session_state.get(
-            f"edit_alternatives_{section}_{question_idx}", ""
+            f"edit_alternatives_{question_id}", ""
         )
         question.alternativas = [alt.strip() for alt in alternatives_text.split(",")]
 
-    st.session_state.editing_question = None
-    st.session_state.editing_answer = None
-    st.session_state.editing_alternatives = None
-    st.session_state.editing_section = None
+    get_session().editing_questions.discard(question_id)
 
 
-def show_card_question(
+# Cada tarjeta es un fragmento: editar una pregunta solo vuelve a dibujar
+# su tarjeta
+@st.fragment
+def show_card_question(question_id: str):
     question_answer: Union[
-        DevelopmentQuestion, MultipleChoiceQuestion, TrueFalseQuestion
-    ],
-    idx: int,
-    section: str,
-):
-    is_editing = (
-        st.session_state.editing_question == idx
-        and st.session_state.editing_section == section
-    )
+        DevelopmentQuestion, MultipleChoiceQuestion, TrueFalseQuestion, None
+    ] = get_question(question_id)
+    if question_answer is None:
+        return
+    is_editing = question_id in get_session().editing_questions
 
     # Crear un contenedor con borde y padding
     with st.container():
@@ -202,7 +106,7 @@ def show_card_question(
                 st.text_input(
                     "Pregunta",
                     value=question_answer.pregunta,
-                    key=f"edit_question_{section}_{idx}",
+                    key=f"edit_question_{question_id}",
                 )
             else:
                 st.markdown(f"**Pregunta:** {question_answer.pregunta}")
@@ -210,18 +114,18 @@ def show_card_question(
         with col2:
             st.button(
                 "✏️",
-                key=f"edit_{section}_{idx}",
+                key=f"edit_{question_id}",
                 on_click=toggle_edit_mode,
-                args=(idx, section),
+                args=(question_id,),
             )
 
         with col3:
             if is_editing:
                 st.button(
                     "💾",
-                    key=f"save_{section}_{idx}",
+                    key=f"save_{question_id}",
                     on_click=save_edits,
-                    args=(idx, section),
+                    args=(question_id,),
                 )
 
         # Segunda fila: Respuesta y alternativas
@@ -229,14 +133,14 @@ def show_card_question(
             st.text_area(
                 "Respuesta",
                 value=question_answer.respuesta,
-                key=f"edit_answer_{section}_{idx}",
+                key=f"edit_answer_{question_id}",
             )
 
             if type(question_answer).__name__ == "MultipleChoiceQuestion":
                 st.text_input(
                     "Alternativas (separadas por comas)",
                     value=", ".join(question_answer.alternativas),
-                    key=f"edit_alternatives_{section}_{idx}",
+                    key=f"edit_alternatives_{question_id}",
                 )
         else:
             st.markdown(f"**Respuesta:** {question_answer.respuesta}")
@@ -247,22 +151,153 @@ def show_card_question(
 
 
 # Funciones para seleccionar y eliminar preguntas
-def select_question(question):
-    if "questions_selected" not in st.session_state:
-        st.session_state.questions_selected = []
-    st.session_state.questions_selected.append(question)
-    st.session_state.questions_generated.remove(question)
+def select_question(question_id):
+    session = get_session()
+    if question_id in session.questions_generated:
+        session.questions_selected[question_id] = session.questions_generated.pop(
+            question_id
+        )
+
+
+def delete_question(question_id):
+    session = get_session()
+    session.questions_selected.pop(question_id, None)
+    session.editing_questions.discard(question_id)
+
+
+def select_bank_question(question):
+    session = get_session()
+    session.questions_selected.update(new_question_ids([question]))
+    session.question_index.add(question.pregunta)
+
+
+# Función para descargar la prueba y guardar sus preguntas en el banco
+def download_test(questions, topic, difficulty, source_digest, with_answers):
+    save_questions(questions, topic, difficulty, source_digest)
+    return get_test_pdf(questions, topic, with_answers)
+
+
+# Función para generar las preguntas en segundo plano. Devuelve las
+# preguntas y los mensajes de error para mostrarlos en la página
+def generate_evaluation(
+    llm,
+    question_type,
+    question_counts,
+    bibliography_index,
+    prompt_input,
+    extra_comments,
+    excluded_questions,
+):
+    with span("evaluation_generation", question_type=question_type):
+        # Enviar solo una parte estable de la bibliografía y los fragmentos
+        # relevantes para el pedido
+        context_types = (
+            list(QUESTION_TYPES) if question_type == "Mixta" else [question_type]
+        )
+        query = " ".join([prompt_input["topic"], extra_comments] + context_types)
+        prompt_input = {
+            **prompt_input,
+            **bibliography_input(bibliography_index, query),
+        }
+
+        # Los pedidos grandes se reparten en llamadas paralelas, cada una
+        # enfocada en una parte distinta de la clase
+        counts = question_counts or {question_type: prompt_input["question_quantity"]}
+        hints = focus_hints(
+            bibliography_index,
+            query,
+            max(len(shard_sizes(count)) for count in counts.values()),
+        )
+
+        # Generar las preguntas. En modo mixto cada tipo se genera en paralelo
+        if question_type == "Mixta":
+            questions, errors = generate_mixed_questions(
+                llm,
+                question_counts,
+                prompt_input,
+                extra_comments,
+                excluded_questions,
+                hints,
+            )
+            errors = [
+                f"Error al generar las preguntas de {failed_type}: {e}"
+                for failed_type, e in errors
+            ]
+        else:
+            try:
+                questions = generate_questions(
+                    llm,
+                    question_type,
+                    prompt_input,
+                    extra_comments,
+                    excluded_questions,
+                    hints,
+                )
+                errors = []
+            except Exception as e:
+                return [], [f"Error al generar las preguntas: {e}"]
+
+        # El modelo puede entregar menos preguntas válidas que las pedidas
+        if not errors and len(questions) < prompt_input["question_quantity"]:
+            errors.append(
+                f"Solo se generaron {len(questions)} de "
+                f"{prompt_input['question_quantity']} preguntas válidas."
+            )
+        return questions, errors
+
+
+# Función para agregar al estado las preguntas de un trabajo terminado
+def apply_generation_job(job):
+    session = get_session()
+    if job.status == FAILED:
+        questions, errors = [], [f"Error al generar las preguntas: {job.error}"]
+    else:
+        questions, errors = job.result
+
+    notices = [("error", error) for error in errors]
+    if errors:
+        notices.append(("text", "Intentalo de nuevo."))
+
+    # Descartar las preguntas que repiten otras ya generadas
+    questions, duplicates = session.question_index.filter_new(questions)
+    if duplicates:
+        notices.append(("info", f"Se descartaron {duplicates} preguntas repetidas."))
+
+    # La tanda anterior se libera antes de revisar el límite de memoria, así
+    # el límite nunca descarta las preguntas recién generadas
+    session.questions_generated = {}
+    forgotten = get_session_store().enforce_limit(session)
+    if forgotten:
+        notices.append(
+            (
+                "warning",
+                "Se alcanzó el límite de memoria de la sesión, por lo que se "
+                f"olvidaron {forgotten} preguntas anteriores que se usaban para "
+                "evitar repeticiones. Podrían volver a aparecer.",
+            )
+        )
+
+    # Agregar las preguntas generadas al estado
+    session.questions_generated = new_question_ids(questions)
+    st.session_state.generation_notices = notices
 
 
-def delete_question(question):
-    st.session_state.questions_selected.remove(question)
+# Avance de la generación en curso. Al terminar, sus preguntas se agregan al
+# estado y se vuelve a ejecutar la página para mostrarlas
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def show_generation_progress(key):
+    job = get_job_queue().get(key)
+    if job is None or job.finished:
+        # Solo la primera ejecución que ve el trabajo terminado lo aplica
+        if st.session_state.pop("generation_job", None) == key and job is not None:
+            apply_generation_job(job)
+        st.rerun()
+    st.info(f"Generando preguntas... ({job.elapsed():.0f} s)")
 
 
-# Iniciar variables de estado
-if "questions_generated" not in st.session_state:
-    st.session_state.questions_generated = []
-if "questions_selected" not in st.session_state:
-    st.session_state.questions_selected = []
+# Datos de la sesión: preguntas, índice de duplicados y estado de edición.
+# Se guardan fuera de st.session_state para acotar su memoria
+session = get_session()
 
 
 # Interfaz de usuario
@@ -286,17 +321,32 @@ st.markdown(
 # Selección de parámetros
 topic = st.text_input("Ingresa el tema de la evaluación")
 
-num_questions = st.number_input(
-    "¿Cuántas preguntas quieres generar? (Entre 1 y 20)",
-    min_value=1,
-    max_value=20,
-    step=1,
-)
 question_type = st.selectbox(
     "¿Qué tipo de preguntas quieres generar?",
-    ["Alternativas", "Desarrollo", "Verdadero y Falso"],
+    list(QUESTION_TYPES) + ["Mixta"],
+    help="En una evaluación mixta indicas cuántas preguntas quieres de cada tipo.",
 )
 
+if question_type == "Mixta":
+    question_counts = {}
+    for column, mixed_type in zip(st.columns(len(QUESTION_TYPES)), QUESTION_TYPES):
+        with column:
+            question_counts[mixed_type] = st.number_input(
+                f"Preguntas de {mixed_type} (Entre 0 y 20)",
+                min_value=0,
+                max_value=20,
+                step=1,
+                key=f"num_questions_{mixed_type}",
+            )
+    num_questions = sum(question_counts.values())
+else:
+    num_questions = st.number_input(
+        "¿Cuántas preguntas quieres generar? (Entre 1 y 20)",
+        min_value=1,
+        max_value=20,
+        step=1,
+    )
+
 uploaded_bibliography = st.file_uploader(
     "Sube una clase en la que quieras basar las preguntas", type=["pdf"]
 )
@@ -314,20 +364,76 @@ extra_comments = st.text_area(
     "Comentarios adicionales (cualquier especificación acerca de las preguntas a crear)"
 )
 
+fresh_questions = st.checkbox(
+    "Generar variaciones nuevas",
+    help=(
+        "Por defecto se reutilizan las preguntas ya generadas con los mismos "
+        "parámetros. Marca esta opción para pedir preguntas distintas."
+    ),
+)
+llm = get_chat_model(temperature=1, use_cache=not fresh_questions)
+
 # Leer la bibliografía y preguntas tipo subidas
 bibliography_text = ""
 sample_questions_text = ""
 
+source_digest = None
+
 if uploaded_bibliography:
-    bibliography_text = extract_text_from_pdf(uploaded_bibliography)
+    try:
+        bibliography_text = extract_text_from_pdf(uploaded_bibliography)
+        bibliography_index = load_bibliography_index(bibliography_text)
+        source_digest = get_file_digest(uploaded_bibliography)
+    except PdfLimitError as e:
+        st.error(f"No se pudo leer la clase. {e}")
+        uploaded_bibliography = None
 
 if uploaded_sample_questions:
-    sample_questions_text = extract_text_from_pdf(uploaded_sample_questions)
+    try:
+        sample_questions_text = extract_text_from_pdf(uploaded_sample_questions)
+    except PdfLimitError as e:
+        st.error(f"No se pudieron leer las preguntas tipo. {e}")
+        uploaded_sample_questions = None
 
 if uploaded_bibliography and uploaded_sample_questions:
     st.success("Archivos cargados correctamente.")
 
-# Generar preguntas
+# Buscar en el banco preguntas guardadas en evaluaciones anteriores antes
+# de generar preguntas nuevas
+if topic:
+    selected_texts = {
+        question.pregunta for question in session.questions_selected.values()
+    }
+    bank_questions = [
+        question
+        for question in search_questions(
+            " ".join([topic, extra_comments]),
+            question_types=None if question_type == "Mixta" else [question_type],
+            difficulty=difficulty,
+            source_digest=source_digest,
+        )
+        if question.pregunta not in selected_texts
+    ]
+    if bank_questions:
+        with st.expander(
+            f"Preguntas de evaluaciones anteriores ({len(bank_questions)})"
+        ):
+            for idx, question in enumerate(bank_questions):
+                col1, col2 = st.columns([0.5, 4])
+                with col1:
+                    st.button(
+                        "Agregar",
+                        key=f"select_bank_{idx}",
+                        on_click=select_bank_question,
+                        args=(question,),
+                    )
+                with col2:
+                    st.markdown(f"**Pregunta:** {question.pregunta}")
+                    st.markdown(f"**Respuesta:** {question.respuesta}")
+
+# Generar preguntas. La generación se encola como un trabajo en segundo
+# plano, así otras interacciones con la página no la interrumpen ni la
+# repiten
 if (
     st.button("Generar preguntas nuevas")
     and uploaded_bibliography
@@ -336,104 +442,130 @@ if (
     and question_type
     and difficulty
 ):
-    # Seleccionar el template de output
-    complete_system_template_message = system_template_message
-
-    if extra_comments:
-        complete_system_template_message += "\n" + comentarios_adicionales.format(
-            comments=extra_comments
-        )
-
-    if question_type == "Desarrollo":
-        complete_system_template_message += "\n" + output_desarrollo_template
-        structured_llm = llm.with_structured_output(DevelopmentQuestionList)
-    elif question_type == "Alternativas":
-        complete_system_template_message += "\n" + output_alternativas_template
-        structured_llm = llm.with_structured_output(MultipleChoiceQuestionList)
-    elif question_type == "Verdadero y Falso":
-        complete_system_template_message += "\n" + output_verdadero_falso_template
-        structured_llm = llm.with_structured_output(TrueFalseQuestionList)
-    # Crear el prompt para LLM
-    prompt_template = ChatPromptTemplate.from_messages(
-        messages=[
-            ("system", complete_system_template_message),
-            ("user", user_template_message),
-        ]
-    )
-    chain = prompt_template | structured_llm
-
     # Crear el input para el modelo
     prompt_input = {
-        "bibliography": bibliography_text,
         "sample_questions": sample_questions_text,
         "question_quantity": num_questions,
-        "question_type": question_type,
         "difficulty": difficulty,
         "topic": topic,
     }
-
-    # Generar las preguntas
+    counts = question_counts if question_type == "Mixta" else None
+    excluded_questions = session.question_index.exclusion_list()
+    key = job_key(
+        "evaluation",
+        get_session_id(),
+        question_type,
+        counts,
+        source_digest,
+        prompt_input,
+        extra_comments,
+        excluded_questions,
+        fresh_questions,
+    )
+    # Una generación con otros datos reemplaza a la anterior, que se descarta
+    # para no gastar llamadas al modelo en preguntas que no se mostrarán
+    previous = st.session_state.get("generation_job")
+    if previous is not None and previous != key:
+        get_job_queue().cancel(previous)
     try:
-        questions_json = chain.invoke(prompt_input)
-        questions = parse_question_jsons(questions_json)
-    except Exception as e:
-        st.error(f"Error al generar las preguntas: {e}")
-        st.text("Intentalo de nuevo.")
-        questions = []
+        job = get_job_queue().submit(
+            key,
+            "evaluation_generation",
+            generate_evaluation,
+            llm,
+            question_type,
+            counts,
+            bibliography_index,
+            prompt_input,
+            extra_comments,
+            excluded_questions,
+        )
+        st.session_state.generation_job = job.key
+    except JobQueueFullError as e:
+        st.error(str(e))
 
-    # Agregar las preguntas generadas al estado
-    st.session_state.questions_generated = questions
+# La generación sigue en curso aunque se cambie de página y se vuelva
+if "generation_job" in st.session_state:
+    show_generation_progress(st.session_state.generation_job)
 
+# Mensajes de la última generación
+for kind, notice in st.session_state.pop("generation_notices", []):
+    getattr(st, kind)(notice)
 
-# Mostrar las preguntas generadas
-if st.session_state.questions_generated:
-    st.markdown("## Preguntas generadas:")
-    st.markdown(" ")
 
-    for idx, question_answer in enumerate(st.session_state.questions_generated):
-        col1, col2 = st.columns([0.5, 4])
-        with col1:
-            st.button(
-                "Agregar",
-                key=f"select_{idx}",
-                on_click=select_question,
-                args=(question_answer,),
-            )
-        with col2:
-            show_card_question(question_answer, idx, "generated")
-        st.markdown("---")  # Línea divisoria sutil
+# Las listas de preguntas y las descargas forman un fragmento: agregar o
+# eliminar una pregunta no vuelve a ejecutar el resto de la página
+@st.fragment
+def show_question_lists(topic, difficulty, source_digest):
+    session = get_session()
 
-# Mostrar las preguntas seleccionadas
-if st.session_state.questions_selected:
-    st.markdown("## Preguntas seleccionadas:")
-    st.markdown(" ")
+    # Mostrar las preguntas generadas
+    if session.questions_generated:
+        st.markdown("## Preguntas generadas:")
+        st.markdown(" ")
 
-    for idx, question in enumerate(st.session_state.questions_selected):
-        col1, col2 = st.columns([0.5, 4])
-        with col1:
-            st.button(
-                "Eliminar",
-                key=f"delete_{idx}",
-                on_click=delete_question,
-                args=(question,),
-            )
-        with col2:
-            show_card_question(question, idx, "selected")
-        st.markdown("---")  # Línea divisoria sutil
-
-# Un solo botón para generar y descargar el PDF
-if st.session_state.questions_selected:
-    st.download_button(
-        label="Descargar Pauta",
-        data=convert_test_to_pdf(st.session_state.questions_selected, topic),
-        file_name=f"Prueba de {topic}.pdf",
-        mime="application/pdf",
-    )
-    st.download_button(
-        label="Descargar Pauta sin respuestas",
-        data=convert_test_to_pdf_without_answers(
-            st.session_state.questions_selected, topic
-        ),
-        file_name=f"Prueba de {topic} sin respuestas.pdf",
-        mime="application/pdf",
-    )
+        for question_id in session.questions_generated:
+            col1, col2 = st.columns([0.5, 4])
+            with col1:
+                st.button(
+                    "Agregar",
+                    key=f"select_{question_id}",
+                    on_click=select_question,
+                    args=(question_id,),
+                )
+            with col2:
+                show_card_question(question_id)
+            st.markdown("---")  # Línea divisoria sutil
+
+    # Mostrar las preguntas seleccionadas
+    if session.questions_selected:
+        st.markdown("## Preguntas seleccionadas:")
+        st.markdown(" ")
+
+        for question_id in session.questions_selected:
+            col1, col2 = st.columns([0.5, 4])
+            with col1:
+                st.button(
+                    "Eliminar",
+                    key=f"delete_{question_id}",
+                    on_click=delete_question,
+                    args=(question_id,),
+                )
+            with col2:
+                show_card_question(question_id)
+            st.markdown("---")  # Línea divisoria sutil
+
+    # Botones de descarga: los PDFs se generan solo al hacer clic y se
+    # reutilizan mientras las preguntas seleccionadas no cambien. Al
+    # descargar, las preguntas seleccionadas se guardan en el banco
+    if session.questions_selected:
+        selected_questions = list(session.questions_selected.values())
+        st.download_button(
+            label="Descargar Pauta",
+            data=partial(
+                download_test,
+                selected_questions,
+                topic,
+                difficulty,
+                source_digest,
+                True,
+            ),
+            file_name=f"Prueba de {topic}.pdf",
+            mime="application/pdf",
+        )
+        st.download_button(
+            label="Descargar Pauta sin respuestas",
+            data=partial(
+                download_test,
+                selected_questions,
+                topic,
+                difficulty,
+                source_digest,
+                False,
+            ),
+            file_name=f"Prueba de {topic} sin respuestas.pdf",
+            mime="application/pdf",
+        )
+
+
+show_question_lists(topic, difficulty, source_digest)
@@ -1,10 +1,20 @@
 from pydantic import BaseModel, Field
 from typing import List
 import streamlit as st
-from langchain_openai import ChatOpenAI
+from utils.jobs import (
+    FAILED,
+    JOB_POLL_SECONDS,
+    JobQueueFullError,
+    get_job_queue,
+    job_key,
+)
+from utils.llm_clients import get_chat_model
+from utils.metrics import span
+from utils.rate_limit import PRIORITY_BACKGROUND, llm_priority
+from utils.session_store import get_session_id
 
-# Configurar OpenAI
-OPENAI_API_KEY = st.secrets["OPENAI_API_KEY"]
+# Cantidad máxima de verificaciones de referencias en paralelo
+MAX_VERIFICACIONES_EN_PARALELO = 5
 
 
 class ReferenciaBibliografica(BaseModel):
@@ -36,26 +46,28 @@ class ExistenciaReferencia(BaseModel):
     existe: bool = Field(description="Indica si la referencia bibliográfica existe")
 
 
-def buscar_bibliografia_sin_links(tema: str) -> List[ReferenciaBibliografica]:
-    llm = ChatOpenAI(api_key=OPENAI_API_KEY, temperature=0.7, model="gpt-4o-mini")
+def buscar_bibliografia_sin_links(
+    tema: str, use_cache: bool = True
+) -> List[ReferenciaBibliografica]:
+    llm = get_chat_model(temperature=0.7, use_cache=use_cache)
     structured_llm = llm.with_structured_output(ListaReferencias)
 
     prompt = f"""Genera 5 referencias bibliográficas académicas sobre '{tema}'.
     Cada referencia debe incluir título, autores, año de publicación y editorial si está disponible."""
 
-    try:
-        resultado = structured_llm.invoke(prompt)
-        return resultado.referencias
-    except Exception as e:
-        st.error(f"Error al procesar las referencias: {str(e)}")
-        return []
+    resultado = structured_llm.invoke(prompt)
+    return resultado.referencias
 
 
-def supervisar_bibliografia(referencias: List[ReferenciaBibliografica]):
+def supervisar_bibliografia(
+    referencias: List[ReferenciaBibliografica], use_cache: bool = True
+):
     """
     Busca si las referencias entregadas realmente existen según el conocimiento del LLM.
+    Las verificaciones se hacen en paralelo y se mantiene el orden original.
+    Devuelve las referencias válidas y la cantidad que no se pudo verificar.
     """
-    llm = ChatOpenAI(api_key=OPENAI_API_KEY, temperature=0.7, model="gpt-4o-mini")
+    llm = get_chat_model(temperature=0.7, use_cache=use_cache)
     structured_llm = llm.with_structured_output(ExistenciaReferencia)
 
     prompt = """
@@ -63,13 +75,40 @@ def supervisar_bibliografia(referencias: List[ReferenciaBibliografica]):
     {referencia}
     Revisa si realmente estás seguro de que existe la referencia bibliográfica.
     """
+    # Las verificaciones ceden el turno a las llamadas que un profesor está
+    # esperando en pantalla
+    with llm_priority(PRIORITY_BACKGROUND):
+        resultados = structured_llm.batch(
+            [prompt.format(referencia=ref) for ref in referencias],
+            config={"max_concurrency": MAX_VERIFICACIONES_EN_PARALELO},
+            return_exceptions=True,
+        )
+
     referencias_validas = []
-    for ref in referencias:
-        prompt_ref = prompt.format(referencia=ref)
-        resultado = structured_llm.invoke(prompt_ref)
-        if resultado.existe:
+    verificaciones_fallidas = 0
+    for ref, resultado in zip(referencias, resultados):
+        if resultado is None or isinstance(resultado, Exception):
+            verificaciones_fallidas += 1
+        elif resultado.existe:
             referencias_validas.append(ref)
-    return referencias_validas
+    return referencias_validas, verificaciones_fallidas
+
+
+# Función para buscar y verificar las referencias en segundo plano
+def buscar_bibliografia(tema: str, use_cache: bool = True):
+    with span("bibliography_search"):
+        referencias = buscar_bibliografia_sin_links(tema, use_cache=use_cache)
+        return supervisar_bibliografia(referencias, use_cache=use_cache)
+
+
+# Avance de la búsqueda en curso. Al terminar se vuelve a ejecutar la
+# página para mostrar las referencias
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def mostrar_avance(key):
+    job = get_job_queue().get(key)
+    if job is None or job.finished:
+        st.rerun()
+    st.info(f"Buscando referencias... ({job.elapsed():.0f} s)")
 
 
 # Interfaz en Streamlit
@@ -77,33 +116,67 @@ st.title("Buscador de Bibliografía Académica")
 tema = st.text_input(
     "Ingresa el tema que deseas estudiar (ej: probabilidades avanzadas):"
 )
+nueva_busqueda = st.checkbox(
+    "Buscar referencias nuevas",
+    help="Ignora los resultados ya obtenidos para el mismo tema.",
+)
 
+# La búsqueda se encola como un trabajo en segundo plano, así otras
+# interacciones con la página no la interrumpen ni la repiten
 if st.button("Buscar"):
     if tema:
-        referencias = buscar_bibliografia_sin_links(tema)
-        referencias_validas = supervisar_bibliografia(referencias)
-        st.write("### Bibliografía recomendada:")
-
-        if referencias_validas == []:
-            st.markdown("No se encontraron referencias bibliográficas válidas.")
-        else:
-            for ref in referencias_validas:
-                # Mostrar cada referencia en formato continuo
-                referencia_texto = f"""**Título:** {ref.titulo}
-                **Autores:** {ref.autores}
-                **Año:** {ref.anio}"""
-
-                if ref.editorial:
-                    referencia_texto += f"""
-                    **Editorial:** {ref.editorial}"""
-
-                st.markdown(referencia_texto)
-
-                # Botón de búsqueda en Google
-                st.markdown(
-                    f"[Buscar en Google](https://www.google.com/search?q={ref.titulo.replace(' ', '+')})",
-                    unsafe_allow_html=True,
-                )
-                st.markdown("---")
+        key = job_key("bibliography", get_session_id(), tema, nueva_busqueda)
+        # Una búsqueda de otro tema reemplaza a la anterior, que se descarta
+        previous = st.session_state.get("bibliography_job")
+        if previous is not None and previous != key:
+            get_job_queue().cancel(previous)
+        try:
+            job = get_job_queue().submit(
+                key,
+                "bibliography_search",
+                buscar_bibliografia,
+                tema,
+                use_cache=not nueva_busqueda,
+            )
+            st.session_state.bibliography_job = job.key
+        except JobQueueFullError as e:
+            st.error(str(e))
     else:
         st.write("Por favor, ingresa un tema.")
+
+# El resultado se mantiene al cambiar de página y volver
+job = get_job_queue().get(st.session_state.get("bibliography_job"))
+if job is not None and not job.finished:
+    mostrar_avance(job.key)
+elif job is not None and job.status == FAILED:
+    st.error(f"Error al procesar las referencias: {job.error}")
+elif job is not None:
+    referencias_validas, verificaciones_fallidas = job.result
+    if verificaciones_fallidas:
+        st.warning(
+            f"No se pudieron verificar {verificaciones_fallidas} referencias, "
+            "por lo que no se muestran."
+        )
+    st.write("### Bibliografía recomendada:")
+
+    if referencias_validas == []:
+        st.markdown("No se encontraron referencias bibliográficas válidas.")
+    else:
+        for ref in referencias_validas:
+            # Mostrar cada referencia en formato continuo
+            referencia_texto = f"""**Título:** {ref.titulo}
+            **Autores:** {ref.autores}
+            **Año:** {ref.anio}"""
+
+            if ref.editorial:
+                referencia_texto += f"""
+                **Editorial:** {ref.editorial}"""
+
+            st.markdown(referencia_texto)
+
+            # Botón de búsqueda en Google
+            st.markdown(
+                f"[Buscar en Google](https://www.google.com/search?q={ref.titulo.replace(' ', '+')})",
+                unsafe_allow_html=True,
+            )
+            st.markdown("---")
@@ -0,0 +1,127 @@
+import resource
+import pandas as pd
+import streamlit as st
+from utils.llm_cache import get_response_cache
+from utils.llm_clients import get_setting
+from utils.metrics import get_metrics_store
+from utils.session_store import get_session_store
+
+# Configuración de la página
+st.set_page_config(page_title="Métricas", page_icon="📊", layout="wide")
+
+st.title("Métricas de rendimiento 📊")
+
+# La página solo se muestra si se habilita en la configuración
+if not get_setting("METRICS_PAGE_ENABLED", False):
+    st.info(
+        "Esta página está deshabilitada. Define METRICS_PAGE_ENABLED=true en "
+        "las variables de entorno o en secrets.toml para habilitarla."
+    )
+    st.stop()
+
+store = get_metrics_store()
+records = pd.DataFrame(store.records())
+
+if st.button("Borrar métricas"):
+    store.clear()
+    st.rerun()
+
+# Memoria del proceso y de los datos de cada sesión
+st.markdown("## Memoria")
+sessions = get_session_store().memory_report()
+col1, col2, col3 = st.columns(3)
+col1.metric(
+    "Memoria máxima del proceso",
+    f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB",
+)
+col2.metric("Sesiones activas", len(sessions))
+col3.metric(
+    "Memoria de las sesiones",
+    f"{sum(row['memoria (KB)'] for row in sessions) / 1024:.1f} MB",
+)
+if sessions:
+    st.dataframe(pd.DataFrame(sessions), use_container_width=True, hide_index=True)
+
+# Caché de respuestas del modelo
+st.markdown("## Caché de respuestas")
+st.json(get_response_cache().stats())
+
+if records.empty:
+    st.markdown("Aún no hay métricas registradas en este servidor.")
+    st.stop()
+
+st.markdown(
+    f"{len(records)} registros desde "
+    f"{pd.to_datetime(records['timestamp'].min(), unit='s'):%Y-%m-%d %H:%M:%S} UTC."
+)
+
+# Tiempos por etapa
+st.markdown("## Tiempo por etapa (segundos)")
+durations = records.groupby("stage")["duration_s"]
+st.dataframe(
+    pd.DataFrame(
+        {
+            "llamadas": durations.count(),
+            "p50": durations.quantile(0.5),
+            "p90": durations.quantile(0.9),
+            "p99": durations.quantile(0.99),
+            "máximo": durations.max(),
+            "total": durations.sum(),
+        }
+    ).sort_values("total", ascending=False),
+    use_container_width=True,
+)
+
+# Tokens que se ahorran al limpiar el texto de los PDF
+if "tokens_saved" in records:
+    extractions = records[records["stage"] == "pdf_extraction"]
+    st.metric(
+        "Tokens ahorrados al limpiar los PDF",
+        f"{int(extractions['tokens_saved'].fillna(0).sum()):,}",
+    )
+
+# Tokens y costo de las llamadas al modelo
+llm_calls = records[records["stage"] == "llm_call"]
+if not llm_calls.empty:
+    st.markdown("## Llamadas al modelo")
+    by_model = llm_calls.groupby("model")
+    st.dataframe(
+        pd.DataFrame(
+            {
+                "llamadas": by_model.size(),
+                "desde caché": by_model["cached"].sum(),
+                "tokens de entrada": by_model["prompt_tokens"].sum(),
+                "tokens de entrada en caché": by_model["cached_tokens"].sum(),
+                "tokens de salida": by_model["completion_tokens"].sum(),
+                "costo (USD)": by_model["cost_usd"].sum(),
+            }
+        ),
+        use_container_width=True,
+    )
+
+    # Costo de cada acción del usuario, sumando todas sus llamadas
+    st.markdown("## Costo por acción")
+    requests = records.groupby("request_id")
+    root_stages = records.loc[requests["timestamp"].idxmax(), ["request_id", "stage"]]
+    per_request = (
+        llm_calls.groupby("request_id")[
+            ["prompt_tokens", "completion_tokens", "cost_usd"]
+        ]
+        .sum()
+        .join(root_stages.set_index("request_id"))
+        .join(requests["duration_s"].max())
+    )
+    st.dataframe(
+        per_request.groupby("stage").agg(
+            **{
+                "acciones": ("cost_usd", "size"),
+                "tokens de entrada (p50)": ("prompt_tokens", "median"),
+                "tokens de salida (p50)": ("completion_tokens", "median"),
+                "costo p50 (USD)": ("cost_usd", "median"),
+                "costo p90 (USD)": ("cost_usd", lambda cost: cost.quantile(0.9)),
+                "costo total (USD)": ("cost_usd", "sum"),
+                "duración p90 (s)": ("duration_s", lambda d: d.quantile(0.9)),
+            }
+        ),
+        use_container_width=True,
+    )
@@ -0,0 +1,241 @@
+import re
+from typing import Callable, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+
+from utils.metrics import span
+from utils.retrieval import CHARS_PER_TOKEN, chunk_text, estimate_tokens
+
+# Programas de hasta este tamaño se planifican con una sola llamada. Los más
+# largos se analizan por secciones y luego se unen los análisis
+CURRICULUM_SINGLE_PROMPT_TOKENS = 6000
+# Tamaño máximo de cada sección que se analiza por separado
+CURRICULUM_SECTION_TOKENS = 3000
+# Tokens de salida máximos del análisis de cada sección, para acotar el
+# prompt de la planificación final
+SECTION_NOTES_MAX_TOKENS = 500
+# Cantidad máxima de secciones que se analizan en paralelo
+MAX_SECTION_ANALYSES_IN_PARALLEL = 8
+# Veces que se reintenta el análisis de las secciones que fallaron
+SECTION_ANALYSIS_RETRIES = 1
+
+# Títulos con que suelen comenzar las partes de un programa de curso
+_HEADING_PATTERN = re.compile(
+    r"^\s*(?:unidad|m[oó]dulo|cap[ií]tulo|anexo|evaluaci[oó]n|evaluaciones"
+    r"|bibliograf[ií]a|metodolog[ií]a|objetivos?|resultados de aprendizaje"
+    r"|contenidos?|competencias|descripci[oó]n|calendario|cronograma)\b",
+    re.IGNORECASE,
+)
+_NUMBERED_HEADING_PATTERN = re.compile(r"^\s*(?:\d+|[IVX]+)(?:\.\d+)*[.)]?\s+\S")
+_MAX_HEADING_WORDS = 10
+
+section_template_message = """
+Eres un profesor experto en planificar y actualizar programas de estudios.
+Estás revisando por partes el programa de un curso para proponer su
+actualización. Analiza solo la siguiente sección del programa y entrega notas
+breves en Markdown con:
+- Temas que se mantienen y temas que conviene actualizar, agregar o quitar
+- Cambios en las evaluaciones o en la bibliografía, si la sección los trata
+- Semanas aproximadas que requieren sus contenidos
+
+No escribas la planificación completa, solo las notas de esta sección.
+
+El curso es de {materia}. Estos son los comentarios del profesor:
+{comentarios_profesor}
+
+Sección {number} de {total} del programa:
+{section}
+"""
+
+plan_template_message = """
+Eres un profesor experto en planificar y actualizar programas de estudios.
+Revisaste por partes el programa actual de un curso. Estas son tus notas
+sobre cada sección:
+
+{notes}
+
+El curso es de {materia}. Estos son los comentarios del profesor:
+{comentarios_profesor}
+
+Con base en esto, sugiéreme una actualización del curso, incluyendo:
+- Nuevos temas o cambios en el enfoque
+- Estrategias de evaluación adecuadas para los cambios
+- Resultados de aprendizaje esperados
+- Bibliografía adicional (si es necesario)
+- Una planificación semana a semana
+
+Además, ten en consideración que la duración del curso no debe superar 15 semanas.
+"""
+
+sin_analisis_seccion = """
+No se pudo analizar esta sección. Planifica sus contenidos a partir de las
+demás secciones y de los comentarios del profesor, e indica en la
+planificación que esta parte del programa debe revisarse.
+"""
+
+
+def _is_heading(line: str) -> bool:
+    words = line.split()
+    if not words or len(words) > _MAX_HEADING_WORDS:
+        return False
+    if _HEADING_PATTERN.match(line) or _NUMBERED_HEADING_PATTERN.match(line):
+        return True
+    # Títulos escritos completamente en mayúsculas
+    return line.isupper() and len(words) > 1
+
+
+def _split_long_section(section: str, max_tokens: int) -> List[str]:
+    # Se agregan líneas completas mientras quepan. Las líneas que por sí solas
+    # superan el tamaño se dividen por palabras
+    words_per_part = max(1, max_tokens * CHARS_PER_TOKEN // 6)
+    parts, current = [], []
+    for line in section.splitlines():
+        pieces = (
+            chunk_text(line, words_per_part, 0)
+            if estimate_tokens(line) > max_tokens
+            else [line]
+        )
+        for piece in pieces:
+            if current and estimate_tokens("\n".join(current + [piece])) > max_tokens:
+                parts.append("\n".join(current))
+                current = []
+            current.append(piece)
+    if current:
+        parts.append("\n".join(current))
+    return parts
+
+
+def split_program_sections(
+    text: str, max_tokens: int = CURRICULUM_SECTION_TOKENS
+) -> List[str]:
+    """
+    Divide el programa de un curso en secciones, como unidades, evaluación y
+    bibliografía, de hasta max_tokens tokens. Las secciones cortas
+    consecutivas se unen y las largas se dividen.
+
+    Args:
+        text (str): Texto del programa.
+        max_tokens (int): Tamaño máximo de cada sección.
+    Returns:
+        List[str]: Secciones en el orden del programa.
+
+    Example:
+        >>> split_program_sections("Unidad 1\\n...\\nUnidad 2\\n...", 3000)
+        ['Unidad 1\\n...\\nUnidad 2\\n...']
+    """
+    sections, current = [], []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        if current and _is_heading(line):
+            sections.append("\n".join(current))
+            current = []
+        current.append(line)
+    if current:
+        sections.append("\n".join(current))
+
+    merged = []
+    for section in sections:
+        for part in _split_long_section(section, max_tokens):
+            if merged and estimate_tokens(merged[-1] + "\n" + part) <= max_tokens:
+                merged[-1] += "\n" + part
+            else:
+                merged.append(part)
+    return merged
+
+
+def build_section_prompt(
+    section: str, number: int, total: int, comentarios_profesor: str, materia: str
+) -> str:
+    """
+    Crea el prompt para analizar una sección del programa.
+    """
+    return section_template_message.format(
+        section=section,
+        number=number,
+        total=total,
+        comentarios_profesor=comentarios_profesor,
+        materia=materia,
+    )
+
+
+def build_plan_prompt(
+    notes: List[Optional[str]], comentarios_profesor: str, materia: str
+) -> str:
+    """
+    Crea el prompt que une los análisis de las secciones en la planificación
+    final del curso. Las secciones sin análisis (None) se indican como
+    faltantes.
+    """
+    return plan_template_message.format(
+        notes="\n\n".join(
+            f"### Sección {number}\n"
+            + (note if note is not None else sin_analisis_seccion)
+            for number, note in enumerate(notes, 1)
+        ),
+        comentarios_profesor=comentarios_profesor,
+        materia=materia,
+    )
+
+
+def analyze_sections(
+    llm: BaseChatModel,
+    sections: List[str],
+    comentarios_profesor: str,
+    materia: str,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> List[Optional[str]]:
+    """
+    Analiza en paralelo cada sección del programa según los comentarios del
+    profesor. Las secciones cuyo análisis falla se reintentan hasta
+    SECTION_ANALYSIS_RETRIES veces, sin repetir las que ya se analizaron.
+
+    Args:
+        llm (BaseChatModel): Modelo a consultar.
+        sections (List[str]): Secciones del programa, ver
+            split_program_sections.
+        comentarios_profesor (str): Comentarios del profesor.
+        materia (str): Nombre del curso.
+        on_progress (Callable[[int, int], None]): Se llama con la cantidad de
+            secciones analizadas y el total cada vez que termina una.
+    Returns:
+        List[Optional[str]]: Notas de cada sección, en el mismo orden. Las
+            secciones que no se pudieron analizar quedan en None.
+    Raises:
+        Exception: El error del modelo, si no se pudo analizar ninguna
+            sección.
+    """
+    total = len(sections)
+    prompts = [
+        build_section_prompt(section, number, total, comentarios_profesor, materia)
+        for number, section in enumerate(sections, 1)
+    ]
+    notes: List[Optional[str]] = [None] * total
+    errors = []
+    pending = list(range(total))
+    done = 0
+    analyzer = llm.bind(max_tokens=SECTION_NOTES_MAX_TOKENS)
+    with span("curriculum_section_analysis", sections=total) as attributes:
+        for _ in range(SECTION_ANALYSIS_RETRIES + 1):
+            if not pending:
+                break
+            results = analyzer.batch_as_completed(
+                [prompts[index] for index in pending],
+                config={"max_concurrency": MAX_SECTION_ANALYSES_IN_PARALLEL},
+                return_exceptions=True,
+            )
+            failed = []
+            for position, result in results:
+                if isinstance(result, Exception):
+                    errors.append(result)
+                    failed.append(pending[position])
+                    continue
+                notes[pending[position]] = result.content
+                done += 1
+                if on_progress is not None:
+                    on_progress(done, total)
+            pending = sorted(failed)
+        attributes.update(failed_sections=len(pending), errors=len(errors))
+        if total and len(pending) == total:
+            raise errors[-1]
+    return notes
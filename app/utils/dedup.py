@@ -0,0 +1,126 @@
+import zlib
+from typing import List, Tuple
+
+import numpy as np
+
+from utils.retrieval import tokenize
+
+# Similitud de Jaccard estimada desde la cual dos preguntas son duplicadas
+DUPLICATE_THRESHOLD = 0.6
+# Cantidad de funciones hash de cada firma MinHash
+NUM_PERMUTATIONS = 128
+# Preguntas que recuerda el índice, para acotar la memoria de cada sesión
+MAX_INDEXED_QUESTIONS = 500
+# Preguntas que se envían al modelo para que no las repita
+MAX_EXCLUDED_QUESTIONS = 30
+MAX_EXCLUDED_CHARS = 90
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+
+
+def shingles(text: str) -> set:
+    """
+    Devuelve los términos y pares de términos consecutivos de un texto
+    normalizado, sin tildes ni palabras vacías.
+
+    Args:
+        text (str): Texto de la pregunta.
+    Returns:
+        set: Conjunto de shingles.
+
+    Example:
+        >>> sorted(shingles("¿Qué es la fotosíntesis?"))
+        ['fotosintesis', 'que', 'que fotosintesis']
+    """
+    terms = tokenize(text)
+    return set(terms) | {f"{a} {b}" for a, b in zip(terms, terms[1:])}
+
+
+class QuestionIndex:
+    """
+    Índice de preguntas ya vistas para detectar casi duplicados con firmas
+    MinHash sobre el texto de la pregunta. Al superar max_entries se olvidan
+    las preguntas más antiguas.
+    """
+
+    def __init__(
+        self,
+        threshold: float = DUPLICATE_THRESHOLD,
+        num_permutations: int = NUM_PERMUTATIONS,
+        seed: int = 0,
+        max_entries: int = MAX_INDEXED_QUESTIONS,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        generator = np.random.default_rng(seed)
+        self._a = generator.integers(1, 1 << 32, num_permutations, dtype=np.uint64)
+        self._b = generator.integers(0, 1 << 32, num_permutations, dtype=np.uint64)
+        self.signatures = np.empty((0, num_permutations), dtype=np.uint64)
+        self.texts: List[str] = []
+
+    def signature(self, text: str) -> np.ndarray:
+        """
+        Calcula la firma MinHash de un texto.
+        """
+        hashes = np.array(
+            [zlib.crc32(shingle.encode()) for shingle in shingles(text)] or [0],
+            dtype=np.uint64,
+        )
+        products = hashes[:, None] * self._a % _MERSENNE_PRIME
+        return ((products + self._b) % _MERSENNE_PRIME).min(axis=0)
+
+    def max_similarity(self, signature: np.ndarray) -> float:
+        """
+        Estima la mayor similitud entre una firma y las preguntas del índice.
+        """
+        if not len(self.signatures):
+            return 0.0
+        return float((self.signatures == signature).mean(axis=1).max())
+
+    def add(self, text: str):
+        self.signatures = np.vstack([self.signatures, self.signature(text)])
+        self.texts.append(text)
+        if len(self.texts) > self.max_entries:
+            self.trim(self.max_entries)
+
+    def trim(self, max_entries: int):
+        """
+        Conserva solo las max_entries preguntas más recientes.
+        """
+        self.signatures = self.signatures[len(self.texts) - max_entries :].copy()
+        self.texts = self.texts[-max_entries:] if max_entries else []
+
+    def is_duplicate(self, text: str) -> bool:
+        return self.max_similarity(self.signature(text)) >= self.threshold
+
+    def filter_new(self, questions: list) -> Tuple[list, int]:
+        """
+        Descarta las preguntas casi duplicadas de otras ya vistas o de otras
+        del mismo grupo, y agrega las restantes al índice.
+
+        Args:
+            questions (list): Preguntas recién generadas.
+        Returns:
+            Tuple[list, int]: Preguntas nuevas y cantidad de descartadas.
+        """
+        unique = []
+        for question in questions:
+            if self.is_duplicate(question.pregunta):
+                continue
+            self.add(question.pregunta)
+            unique.append(question)
+        return unique, len(questions) - len(unique)
+
+    def exclusion_list(
+        self,
+        max_questions: int = MAX_EXCLUDED_QUESTIONS,
+        max_chars: int = MAX_EXCLUDED_CHARS,
+    ) -> List[str]:
+        """
+        Devuelve las preguntas más recientes del índice, recortadas, para
+        indicarle al modelo que no las repita.
+        """
+        return [
+            text if len(text) <= max_chars else text[: max_chars - 1] + "…"
+            for text in self.texts[-max_questions:]
+        ]
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import time
+from dataclasses import dataclass
+from io import BytesIO
+from typing import List, Optional
+
+from utils.storage import connect
+
+# Tamaño máximo del texto guardado en disco
+DOCUMENT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# Tiempo de vida de cada documento en segundos
+DOCUMENT_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60
+
+_DATABASE = "documents.sqlite3"
+_PAGE_SEPARATOR = " "
+
+
+@dataclass
+class CachedDocument:
+    """
+    Clase para representar el texto extraído de un PDF guardado en caché.
+    """
+
+    text: str
+    page_offsets: List[int]
+
+    @property
+    def page_count(self) -> int:
+        return len(self.page_offsets) - 1
+
+    def pages(self, first_page: int = 0, last_page: Optional[int] = None) -> List[str]:
+        """
+        Devuelve el texto de cada página en [first_page, last_page).
+        """
+        start = min(max(first_page, 0), self.page_count)
+        stop = self.page_count if last_page is None else min(last_page, self.page_count)
+        return [
+            self.text[self.page_offsets[number] : self.page_offsets[number + 1] - 1]
+            for number in range(start, stop)
+        ]
+
+
+def _connect():
+    connection = connect(_DATABASE)
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS documents (
+            digest TEXT PRIMARY KEY,
+            text TEXT NOT NULL,
+            page_offsets TEXT NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        )
+        """)
+    return connection
+
+
+def file_digest(file: BytesIO) -> str:
+    """
+    Calcula el SHA-256 del contenido de un archivo.
+
+    Args:
+        file (BytesIO): Archivo a resumir.
+    Returns:
+        str: Hash en hexadecimal.
+    """
+    file.seek(0)
+    digest = hashlib.sha256()
+    for block in iter(lambda: file.read(1024 * 1024), b""):
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def get_document(digest: str) -> Optional[CachedDocument]:
+    """
+    Busca el texto extraído de un PDF por el hash de su contenido.
+
+    Args:
+        digest (str): SHA-256 del archivo PDF.
+    Returns:
+        CachedDocument: Documento guardado, o None si no existe o expiró.
+    """
+    now = time.time()
+    connection = _connect()
+    try:
+        with connection:
+            row = connection.execute(
+                "SELECT text, page_offsets FROM documents "
+                "WHERE digest = ? AND created_at > ?",
+                (digest, now - DOCUMENT_CACHE_TTL_SECONDS),
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE documents SET accessed_at = ? WHERE digest = ?",
+                (now, digest),
+            )
+    finally:
+        connection.close()
+    return CachedDocument(text=row[0], page_offsets=json.loads(row[1]))
+
+
+def put_document(digest: str, pages: List[str]) -> CachedDocument:
+    """
+    Guarda el texto de cada página de un PDF y libera espacio eliminando
+    los documentos expirados y los usados hace más tiempo.
+
+    Args:
+        digest (str): SHA-256 del archivo PDF.
+        pages (List[str]): Texto de cada página.
+    Returns:
+        CachedDocument: Documento guardado.
+    """
+    page_offsets = [0]
+    for page in pages:
+        page_offsets.append(page_offsets[-1] + len(page) + len(_PAGE_SEPARATOR))
+    document = CachedDocument(
+        text=_PAGE_SEPARATOR.join(pages), page_offsets=page_offsets
+    )
+    size_bytes = len(document.text.encode("utf-8"))
+    if size_bytes > DOCUMENT_CACHE_MAX_BYTES:
+        return document
+
+    now = time.time()
+    connection = _connect()
+    try:
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    digest,
+                    document.text,
+                    json.dumps(page_offsets),
+                    size_bytes,
+                    now,
+                    now,
+                ),
+            )
+            _evict(connection, now)
+    finally:
+        connection.close()
+    return document
+
+
+def _evict(connection, now: float):
+    connection.execute(
+        "DELETE FROM documents WHERE created_at <= ?",
+        (now - DOCUMENT_CACHE_TTL_SECONDS,),
+    )
+    total_bytes = connection.execute(
+        "SELECT COALESCE(SUM(size_bytes), 0) FROM documents"
+    ).fetchone()[0]
+    if total_bytes <= DOCUMENT_CACHE_MAX_BYTES:
+        return
+    rows = connection.execute(
+        "SELECT digest, size_bytes FROM documents ORDER BY accessed_at"
+    ).fetchall()
+    for digest, size_bytes in rows:
+        if total_bytes <= DOCUMENT_CACHE_MAX_BYTES:
+            break
+        connection.execute("DELETE FROM documents WHERE digest = ?", (digest,))
+        total_bytes -= size_bytes
@@ -0,0 +1,209 @@
+import contextvars
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional
+
+import streamlit as st
+
+from utils.llm_clients import LLM_MAX_CONNECTIONS, get_setting
+from utils.metrics import record
+
+# Cantidad de trabajos que se ejecutan a la vez en el servidor. Los trabajos
+# pasan casi todo el tiempo esperando al modelo, por lo que se permiten
+# tantos como conexiones con OpenAI: el límite real de llamadas lo impone el
+# planificador de la cuota de uso y no esta cola
+JOB_WORKERS = LLM_MAX_CONNECTIONS
+# Cantidad máxima de trabajos esperando su turno
+JOB_MAX_PENDING = 100
+# Tiempo que se guarda el resultado de un trabajo terminado
+JOB_RESULT_TTL_SECONDS = 60 * 60
+# Cada cuánto las páginas revisan el avance de sus trabajos
+JOB_POLL_SECONDS = 1.0
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Trabajo que se está ejecutando en el hilo actual
+_current_job: ContextVar[Optional["Job"]] = ContextVar("current_job", default=None)
+
+
+class JobQueueFullError(RuntimeError):
+    """
+    Hay demasiados trabajos esperando para aceptar uno nuevo.
+    """
+
+
+class Job:
+    """
+    Trabajo en segundo plano. Las páginas lo consultan con su llave en cada
+    ejecución para mostrar su avance y su resultado.
+    """
+
+    def __init__(self, key: str, name: str):
+        self.key = key
+        self.name = name
+        self.status = PENDING
+        # Texto parcial del resultado, por ejemplo la respuesta del modelo
+        # mientras se genera
+        self.progress = ""
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.future: Optional[Future] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def elapsed(self) -> float:
+        return (self.finished_at or time.time()) - self.created_at
+
+
+class JobQueue:
+    """
+    Cola de trabajos con un número acotado de hilos. Los trabajos se
+    identifican con una llave de idempotencia: mientras un trabajo con la
+    misma llave está pendiente o en ejecución, enviarlo de nuevo devuelve
+    el mismo trabajo en lugar de repetir las llamadas al modelo.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = JOB_WORKERS,
+        max_pending: int = JOB_MAX_PENDING,
+        result_ttl_seconds: float = JOB_RESULT_TTL_SECONDS,
+    ):
+        self.max_pending = max_pending
+        self.result_ttl_seconds = result_ttl_seconds
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="job"
+        )
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self, key: str, name: str, function: Callable, *args: Any, **kwargs: Any
+    ) -> Job:
+        """
+        Encola function(*args, **kwargs), salvo que ya haya un trabajo sin
+        terminar con la misma llave. Un trabajo terminado con la misma llave
+        se reemplaza.
+
+        Args:
+            key (str): Llave de idempotencia, ver job_key.
+            name (str): Nombre del trabajo para las métricas.
+            function (Callable): Función a ejecutar en segundo plano.
+        Returns:
+            Job: Trabajo nuevo o el que ya estaba en curso.
+        Raises:
+            JobQueueFullError: Si hay demasiados trabajos esperando.
+
+        Example:
+            >>> job = get_job_queue().submit(key, "bibliography", buscar, tema)
+        """
+        with self._lock:
+            self._evict_finished()
+            job = self._jobs.get(key)
+            if job is not None and not job.finished:
+                return job
+            pending = sum(job.status == PENDING for job in self._jobs.values())
+            if pending >= self.max_pending:
+                raise JobQueueFullError(
+                    "El servidor está recibiendo demasiadas solicitudes. "
+                    "Inténtalo de nuevo en unos minutos."
+                )
+            job = self._jobs[key] = Job(key, name)
+            # El trabajo hereda el contexto de la página, como el
+            # identificador de la acción en las métricas
+            context = contextvars.copy_context()
+            job.future = self._executor.submit(
+                context.run, self._run, job, function, args, kwargs
+            )
+        return job
+
+    def _run(self, job: Job, function: Callable, args: tuple, kwargs: dict):
+        job.started_at = time.time()
+        job.status = RUNNING
+        record("job_wait", job.started_at - job.created_at, job=job.name)
+        token = _current_job.set(job)
+        try:
+            job.result = function(*args, **kwargs)
+            job.status = DONE
+        except Exception as e:
+            job.error = e
+            job.status = FAILED
+        finally:
+            _current_job.reset(token)
+            job.finished_at = time.time()
+
+    def get(self, key: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(key)
+
+    def cancel(self, key: str) -> bool:
+        """
+        Descarta un trabajo que aún no empieza. Los trabajos en ejecución
+        terminan, pero su resultado ya no se usa.
+
+        Returns:
+            bool: Si el trabajo se descartó antes de empezar.
+        """
+        with self._lock:
+            job = self._jobs.pop(key, None)
+        return job is not None and job.future.cancel()
+
+    def _evict_finished(self):
+        now = time.time()
+        expired = [
+            key
+            for key, job in self._jobs.items()
+            if job.finished and now - job.finished_at > self.result_ttl_seconds
+        ]
+        for key in expired:
+            del self._jobs[key]
+
+
+@st.cache_resource
+def get_job_queue() -> JobQueue:
+    """
+    Devuelve la cola de trabajos compartida por todas las páginas.
+    """
+    return JobQueue(
+        max_workers=get_setting(
+            "JOB_WORKERS", get_setting("LLM_MAX_CONNECTIONS", JOB_WORKERS)
+        ),
+        max_pending=get_setting("JOB_MAX_PENDING", JOB_MAX_PENDING),
+        result_ttl_seconds=get_setting(
+            "JOB_RESULT_TTL_SECONDS", JOB_RESULT_TTL_SECONDS
+        ),
+    )
+
+
+def job_key(*parts: Any) -> str:
+    """
+    Calcula la llave de idempotencia de un trabajo a partir de todo lo que
+    determina su resultado.
+
+    Example:
+        >>> job_key("bibliography", session_id, "Fotosíntesis", True)
+    """
+    serialized = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+def report_progress(text: str):
+    """
+    Actualiza el texto parcial del trabajo en ejecución. Fuera de un
+    trabajo no hace nada.
+    """
+    job = _current_job.get()
+    if job is not None:
+        job.progress = text
@@ -0,0 +1,247 @@
+import hashlib
+import json
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+
+import streamlit as st
+from langchain_core.caches import BaseCache
+from langchain_core.language_models import BaseChatModel, LanguageModelInput
+from langchain_core.load import dumps
+from langchain_core.messages import AIMessage, messages_from_dict, messages_to_dict
+from langchain_core.outputs import ChatGeneration, Generation
+
+from utils.storage import connect
+
+# Cantidad máxima de respuestas guardadas
+LLM_CACHE_MAX_ENTRIES = 5000
+# Tiempo de vida de cada respuesta en segundos
+LLM_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+
+_DATABASE = "llm_responses.sqlite3"
+
+# Respuestas del caché que entregaron o guardaron las llamadas del bloque
+# track_responses en curso
+_tracked: ContextVar[Optional[list]] = ContextVar("tracked_responses", default=None)
+
+
+class SQLiteResponseCache(BaseCache):
+    """
+    Caché persistente de respuestas de los modelos de lenguaje.
+
+    La llave es un hash de la configuración del modelo (nombre, temperatura,
+    esquema de salida estructurada) y de los mensajes enviados. Las entradas
+    expiran por tiempo y, al superar el máximo, se eliminan las usadas hace
+    más tiempo.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = LLM_CACHE_TTL_SECONDS,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        connection = connect(_DATABASE)
+        try:
+            with connection:
+                connection.execute("""
+                    CREATE TABLE IF NOT EXISTS responses (
+                        key TEXT PRIMARY KEY,
+                        generations TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        accessed_at REAL NOT NULL
+                    )
+                    """)
+                connection.execute(
+                    "CREATE INDEX IF NOT EXISTS responses_accessed_at "
+                    "ON responses (accessed_at)"
+                )
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode()).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        connection = connect(_DATABASE)
+        try:
+            with connection:
+                row = connection.execute(
+                    "SELECT generations FROM responses "
+                    "WHERE key = ? AND created_at > ?",
+                    (key, now - self.ttl_seconds),
+                ).fetchone()
+                if row is not None:
+                    connection.execute(
+                        "UPDATE responses SET accessed_at = ? WHERE key = ?",
+                        (now, key),
+                    )
+        finally:
+            connection.close()
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._track(key)
+        return [
+            ChatGeneration(message=message)
+            for message in messages_from_dict(json.loads(row[0]))
+        ]
+
+    def update(
+        self, prompt: str, llm_string: str, return_val: Sequence[Generation]
+    ) -> None:
+        if not all(isinstance(gen, ChatGeneration) for gen in return_val):
+            return
+        generations = json.dumps(messages_to_dict([gen.message for gen in return_val]))
+        now = time.time()
+        connection = connect(_DATABASE)
+        try:
+            with connection:
+                key = self._key(prompt, llm_string)
+                connection.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                    (key, generations, now, now),
+                )
+                connection.execute(
+                    "DELETE FROM responses WHERE created_at <= ?",
+                    (now - self.ttl_seconds,),
+                )
+                connection.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    "SELECT key FROM responses ORDER BY accessed_at DESC "
+                    "LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+        finally:
+            connection.close()
+        self._track(key)
+
+    def _track(self, key: str):
+        tracked = _tracked.get()
+        if tracked is not None:
+            tracked.append((self, key))
+
+    def discard(self, keys: Sequence[str]) -> None:
+        """
+        Elimina respuestas guardadas, por ejemplo las que no sirvieron.
+        """
+        connection = connect(_DATABASE)
+        try:
+            with connection:
+                connection.executemany(
+                    "DELETE FROM responses WHERE key = ?", [(key,) for key in keys]
+                )
+        finally:
+            connection.close()
+
+    def clear(self, **kwargs: Any) -> None:
+        connection = connect(_DATABASE)
+        try:
+            with connection:
+                connection.execute("DELETE FROM responses")
+        finally:
+            connection.close()
+
+    def stats(self) -> dict:
+        """
+        Devuelve los contadores de aciertos y fallos del caché.
+
+        Returns:
+            dict: Aciertos, fallos y cantidad de respuestas guardadas.
+        """
+        connection = connect(_DATABASE)
+        try:
+            entries = connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        finally:
+            connection.close()
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+@st.cache_resource
+def get_response_cache() -> SQLiteResponseCache:
+    """
+    Devuelve el caché de respuestas compartido por todas las páginas.
+    """
+    return SQLiteResponseCache()
+
+
+@contextmanager
+def track_responses() -> Iterator[List[Tuple[SQLiteResponseCache, str]]]:
+    """
+    Registra las respuestas del caché que usan las llamadas al modelo hechas
+    dentro del bloque, para poder descartarlas con forget_responses.
+
+    Example:
+        >>> with track_responses() as responses:
+        ...     output = chain.invoke(prompt_input)
+        >>> if not output_is_valid(output):
+        ...     forget_responses(responses)
+    """
+    responses = []
+    token = _tracked.set(responses)
+    try:
+        yield responses
+    finally:
+        _tracked.reset(token)
+
+
+def forget_responses(responses: Sequence[Tuple[SQLiteResponseCache, str]]):
+    """
+    Elimina del caché las respuestas registradas con track_responses, así
+    un nuevo pedido igual vuelve a consultar al modelo.
+    """
+    for cache, key in responses:
+        cache.discard([key])
+
+
+def stream_cached(llm: BaseChatModel, prompt: LanguageModelInput) -> Iterator[str]:
+    """
+    Entrega la respuesta del modelo token a token, consultando antes el
+    caché de respuestas del modelo. En esta versión de LangChain el
+    streaming no pasa por el caché, por lo que se consulta y actualiza
+    con la misma llave que usa invoke.
+
+    Args:
+        llm (BaseChatModel): Modelo a consultar.
+        prompt (LanguageModelInput): Prompt o lista de mensajes.
+    Returns:
+        Iterator[str]: Fragmentos de texto de la respuesta.
+
+    Example:
+        >>> texto = st.write_stream(stream_cached(llm, "Hola"))
+    """
+    if not isinstance(llm.cache, BaseCache):
+        for chunk in llm.stream(prompt):
+            yield chunk.content
+        return
+
+    messages = llm._convert_input(prompt).to_messages()
+    cache_prompt = dumps(messages)
+    llm_string = llm._get_llm_string()
+    cached = llm.cache.lookup(cache_prompt, llm_string)
+    if cached:
+        yield cached[0].message.content
+        return
+
+    content = []
+    for chunk in llm.stream(messages):
+        content.append(chunk.content)
+        yield chunk.content
+    llm.cache.update(
+        cache_prompt,
+        llm_string,
+        [ChatGeneration(message=AIMessage(content="".join(content)))],
+    )
@@ -0,0 +1,136 @@
+import os
+from typing import Any
+
+import httpx
+import streamlit as st
+from langchain_openai import ChatOpenAI
+
+from utils.llm_cache import get_response_cache
+from utils.metrics import get_metrics_callback
+from utils.rate_limit import (
+    LLM_RATE_LIMIT_RETRIES,
+    LLM_REQUESTS_PER_MINUTE,
+    LLM_TOKENS_PER_MINUTE,
+    RateLimitedTransport,
+    RateLimitScheduler,
+)
+
+DEFAULT_MODEL = "gpt-4o-mini"
+
+# Valores por defecto de la conexión con OpenAI. Se pueden sobrescribir con
+# variables de entorno o en secrets.toml usando el mismo nombre.
+LLM_TIMEOUT_SECONDS = 120.0
+LLM_CONNECT_TIMEOUT_SECONDS = 10.0
+LLM_MAX_CONNECTIONS = 50
+LLM_MAX_KEEPALIVE_CONNECTIONS = 20
+LLM_KEEPALIVE_EXPIRY_SECONDS = 60.0
+LLM_MAX_RETRIES = 2
+
+
+def get_setting(name: str, default: Any = None) -> Any:
+    """
+    Lee un parámetro de configuración desde las variables de entorno o,
+    si no está definido ahí, desde los secrets de Streamlit.
+
+    Args:
+        name (str): Nombre del parámetro.
+        default (Any): Valor por defecto. Si no es None, el valor leído se
+            convierte a su mismo tipo.
+    Returns:
+        Any: Valor del parámetro.
+    """
+    value = os.environ.get(name)
+    if value is None:
+        try:
+            value = st.secrets[name]
+        except (KeyError, FileNotFoundError):
+            return default
+    if default is None or isinstance(value, type(default)):
+        return value
+    if isinstance(default, bool):
+        return str(value).lower() in ("1", "true", "yes", "si", "sí")
+    return type(default)(value)
+
+
+@st.cache_resource
+def get_rate_limiter(model: str) -> RateLimitScheduler:
+    """
+    Devuelve el planificador por el que pasan todas las llamadas a un
+    modelo, con la cuota de solicitudes y tokens por minuto de la cuenta.
+    """
+    return RateLimitScheduler(
+        requests_per_minute=get_setting(
+            "LLM_REQUESTS_PER_MINUTE", LLM_REQUESTS_PER_MINUTE
+        ),
+        tokens_per_minute=get_setting("LLM_TOKENS_PER_MINUTE", LLM_TOKENS_PER_MINUTE),
+    )
+
+
+@st.cache_resource
+def _get_http_client(model: str) -> httpx.Client:
+    """
+    Devuelve el pool de conexiones HTTP persistentes de un modelo. Cada
+    solicitud espera su turno en el planificador del modelo.
+    """
+    transport = httpx.HTTPTransport(
+        limits=httpx.Limits(
+            max_connections=get_setting("LLM_MAX_CONNECTIONS", LLM_MAX_CONNECTIONS),
+            max_keepalive_connections=get_setting(
+                "LLM_MAX_KEEPALIVE_CONNECTIONS", LLM_MAX_KEEPALIVE_CONNECTIONS
+            ),
+            keepalive_expiry=get_setting(
+                "LLM_KEEPALIVE_EXPIRY_SECONDS", LLM_KEEPALIVE_EXPIRY_SECONDS
+            ),
+        )
+    )
+    return httpx.Client(
+        transport=RateLimitedTransport(
+            get_rate_limiter(model),
+            transport,
+            max_retries=get_setting("LLM_RATE_LIMIT_RETRIES", LLM_RATE_LIMIT_RETRIES),
+        ),
+        timeout=_get_timeout(),
+    )
+
+
+def _get_timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        get_setting("LLM_TIMEOUT_SECONDS", LLM_TIMEOUT_SECONDS),
+        connect=get_setting("LLM_CONNECT_TIMEOUT_SECONDS", LLM_CONNECT_TIMEOUT_SECONDS),
+    )
+
+
+@st.cache_resource
+def get_chat_model(
+    model: str = DEFAULT_MODEL, temperature: float = 0.7, use_cache: bool = True
+) -> ChatOpenAI:
+    """
+    Devuelve el cliente de chat compartido para una configuración de modelo.
+    Todos los clientes de un mismo modelo reutilizan un único pool de
+    conexiones HTTP con keep-alive y un único planificador de la cuota de
+    uso, y registran el tiempo y los tokens de cada llamada en las métricas.
+
+    Args:
+        model (str): Nombre del modelo de OpenAI.
+        temperature (float): Temperatura de muestreo.
+        use_cache (bool): Si se usa el caché de respuestas.
+    Returns:
+        ChatOpenAI: Cliente listo para usar.
+
+    Example:
+        >>> llm = get_chat_model(temperature=1)
+        >>> llm is get_chat_model(temperature=1)
+        True
+    """
+    return ChatOpenAI(
+        api_key=get_setting("OPENAI_API_KEY"),
+        base_url=get_setting("OPENAI_BASE_URL"),
+        model=model,
+        temperature=temperature,
+        timeout=_get_timeout(),
+        max_retries=get_setting("LLM_MAX_RETRIES", LLM_MAX_RETRIES),
+        http_client=_get_http_client(model),
+        cache=get_response_cache() if use_cache else False,
+        callbacks=[get_metrics_callback()],
+        stream_usage=True,
+    )
@@ -0,0 +1,247 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+from uuid import UUID
+
+import streamlit as st
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+# Cantidad de registros que se mantienen en memoria para la página de métricas
+METRICS_MAX_RECORDS = 10000
+
+# Precio en dólares por millón de tokens de entrada, de entrada leídos desde
+# el caché de prompts del proveedor y de salida
+LLM_PRICES_PER_MILLION_TOKENS = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+}
+
+# Etapa que se registra para cada tipo de paso de una cadena de LangChain
+_CHAIN_STAGES = {"prompt": "prompt_assembly", "parser": "output_parsing"}
+
+logger = logging.getLogger("ayuda_a_tu_profe.metrics")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+# Identificador de la acción del usuario a la que pertenecen los registros
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+
+class MetricsStore:
+    """
+    Registros recientes de tiempos y consumo de tokens del proceso.
+    """
+
+    def __init__(self, max_records: int = METRICS_MAX_RECORDS):
+        self._records = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+
+    def add(self, record: Dict[str, Any]):
+        with self._lock:
+            self._records.append(record)
+
+    def records(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._records)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+
+@st.cache_resource
+def get_metrics_store() -> MetricsStore:
+    """
+    Devuelve el almacén de métricas compartido por todas las páginas.
+    """
+    return MetricsStore()
+
+
+def record(stage: str, duration_s: float, **attributes: Any):
+    """
+    Registra la duración de una etapa y la emite como una línea JSON en el
+    log.
+
+    Args:
+        stage (str): Nombre de la etapa, por ejemplo "pdf_extraction".
+        duration_s (float): Duración en segundos.
+        **attributes: Datos adicionales, como la cantidad de páginas.
+    """
+    entry = {
+        "timestamp": time.time(),
+        "request_id": _request_id.get(),
+        "stage": stage,
+        "duration_s": round(duration_s, 6),
+        **attributes,
+    }
+    get_metrics_store().add(entry)
+    logger.info(json.dumps(entry, ensure_ascii=False, default=str))
+
+
+@contextmanager
+def span(stage: str, **attributes: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Mide el tiempo de un bloque de código. Las etapas anidadas comparten el
+    identificador de la etapa más externa. Los atributos se pueden
+    completar dentro del bloque con el diccionario entregado.
+
+    Args:
+        stage (str): Nombre de la etapa.
+        **attributes: Datos adicionales del registro.
+
+    Example:
+        >>> with span("pdf_extraction", file="clase.pdf") as attributes:
+        ...     text = extract(...)
+        ...     attributes["pages"] = 12
+    """
+    token = None
+    if _request_id.get() is None:
+        token = _request_id.set(uuid.uuid4().hex[:12])
+    start = time.perf_counter()
+    try:
+        yield attributes
+    except Exception as e:
+        attributes["error"] = type(e).__name__
+        raise
+    finally:
+        record(stage, time.perf_counter() - start, **attributes)
+        if token is not None:
+            _request_id.reset(token)
+
+
+def estimate_cost(
+    model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0
+) -> float:
+    """
+    Estima el costo en dólares de una llamada al modelo. Los tokens de
+    entrada leídos desde el caché de prompts del proveedor tienen descuento.
+    """
+    for name, (input_price, cached_price, output_price) in sorted(
+        LLM_PRICES_PER_MILLION_TOKENS.items(), key=lambda item: -len(item[0])
+    ):
+        if model.startswith(name):
+            return (
+                (prompt_tokens - cached_tokens) * input_price
+                + cached_tokens * cached_price
+                + completion_tokens * output_price
+            ) / 1_000_000
+    return 0.0
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    Registra el tiempo y los tokens de cada llamada al modelo, y el tiempo
+    de armado del prompt y de lectura de la salida estructurada.
+    """
+
+    def __init__(self):
+        self._runs: Dict[UUID, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id: UUID, stage: str, **attributes: Any):
+        with self._lock:
+            self._runs[run_id] = {
+                "stage": stage,
+                "start": time.perf_counter(),
+                "request_id": _request_id.get(),
+                **attributes,
+            }
+
+    def _finish(self, run_id: UUID, **attributes: Any):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        token = _request_id.set(run.pop("request_id"))
+        try:
+            record(
+                run.pop("stage"),
+                time.perf_counter() - run.pop("start"),
+                **run,
+                **attributes,
+            )
+        finally:
+            _request_id.reset(token)
+
+    def on_chat_model_start(
+        self, serialized: Dict[str, Any], messages: Any, *, run_id: UUID, **kwargs: Any
+    ):
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model_name") or params.get("model") or "desconocido"
+        self._start(run_id, "llm_call", model=model, streamed=False)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any):
+        with self._lock:
+            if run_id in self._runs:
+                self._runs[run_id]["streamed"] = True
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        with self._lock:
+            run = self._runs.get(run_id, {})
+        usage = {}
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                if getattr(message, "usage_metadata", None):
+                    usage = message.usage_metadata
+        prompt_tokens = usage.get("input_tokens", 0)
+        completion_tokens = usage.get("output_tokens", 0)
+        # Tokens de entrada que el proveedor leyó de su caché de prompts. Solo
+        # vienen en las respuestas sin streaming
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        details = token_usage.get("prompt_tokens_details") or {}
+        cached_tokens = details.get("cached_tokens") or 0
+        # Las respuestas del caché no traen llm_output
+        cached = response.llm_output is None and not run.get("streamed")
+        if cached:
+            prompt_tokens = completion_tokens = cached_tokens = 0
+        self._finish(
+            run_id,
+            cached=cached,
+            prompt_tokens=prompt_tokens,
+            cached_tokens=cached_tokens,
+            completion_tokens=completion_tokens,
+            cost_usd=estimate_cost(
+                run.get("model", ""), prompt_tokens, completion_tokens, cached_tokens
+            ),
+        )
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._finish(run_id, error=type(error).__name__)
+
+    def on_chain_start(
+        self,
+        serialized: Dict[str, Any],
+        inputs: Dict[str, Any],
+        *,
+        run_id: UUID,
+        **kwargs: Any,
+    ):
+        stage = _CHAIN_STAGES.get(kwargs.get("run_type"))
+        if stage is not None:
+            self._start(run_id, stage)
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any):
+        self._finish(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._finish(run_id, error=type(error).__name__)
+
+
+@st.cache_resource
+def get_metrics_callback() -> MetricsCallbackHandler:
+    """
+    Devuelve el callback de métricas compartido por todos los modelos.
+    """
+    return MetricsCallbackHandler()
@@ -0,0 +1,209 @@
+import io
+import mmap
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+import PyPDF2
+
+from utils.storage import CACHE_DIR
+
+# Tamaño máximo de un PDF subido, en bytes
+PDF_MAX_BYTES = int(os.environ.get("PDF_MAX_BYTES", 200 * 1024 * 1024))
+# Páginas máximas que se extraen de un PDF
+PDF_MAX_PAGES = int(os.environ.get("PDF_MAX_PAGES", 1500))
+# Directorio donde se copian los PDFs subidos antes de extraer su texto
+UPLOADS_DIR = os.path.join(CACHE_DIR, "uploads")
+# Páginas que procesa cada tarea enviada al pool de procesos
+PAGES_PER_TASK = 16
+# Bajo esta cantidad de páginas se extrae en el mismo proceso
+PARALLEL_MIN_PAGES = 32
+# Procesos del pool de extracción
+MAX_WORKERS = max(1, min(4, os.cpu_count() or 1))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+class PdfLimitError(ValueError):
+    """
+    Error para PDFs que superan el tamaño o las páginas permitidas.
+    """
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """
+    Devuelve el pool de procesos compartido, creándolo la primera vez o
+    cuando el anterior quedó inutilizable porque murió uno de sus procesos.
+    Se usa "spawn" porque el servidor de Streamlit tiene varios hilos
+    activos y hacer fork en ese estado no es seguro.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool._broken:
+            _pool = ProcessPoolExecutor(
+                max_workers=MAX_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+@contextmanager
+def _mapped_pdf(path: str) -> Iterator[PyPDF2.PdfReader]:
+    """
+    Abre un PDF en disco con memoria mapeada, así el sistema operativo
+    carga solo las partes del archivo que se leen.
+    """
+    with open(path, "rb") as pdf_file:
+        with mmap.mmap(pdf_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield PyPDF2.PdfReader(data)
+
+
+def _extract_page_range(path: str, start: int, stop: int) -> List[str]:
+    """
+    Extrae el texto de las páginas [start, stop) de un PDF en disco.
+    """
+    with _mapped_pdf(path) as reader:
+        return [reader.pages[number].extract_text() for number in range(start, stop)]
+
+
+def _submit_tasks(path: str, tasks: List[Tuple[int, int]]) -> List[Future]:
+    """
+    Envía al pool la extracción de cada rango de páginas [start, stop).
+    """
+    pool = _get_pool()
+    return [
+        pool.submit(_extract_page_range, path, start, stop) for start, stop in tasks
+    ]
+
+
+def _file_size(file: BinaryIO) -> int:
+    """
+    Devuelve el tamaño de un PDF sin leerlo, para rechazar los que superan
+    el máximo antes de copiarlos a disco.
+    """
+    if isinstance(file, (str, os.PathLike)):
+        return os.path.getsize(file)
+    position = file.tell()
+    size = file.seek(0, os.SEEK_END)
+    file.seek(position)
+    return size
+
+
+@contextmanager
+def _pdf_path(file: BinaryIO) -> Iterator[str]:
+    """
+    Entrega la ruta de un PDF en disco. Si el archivo está en memoria, como
+    los que entrega st.file_uploader, se copia a un archivo temporal que se
+    elimina al terminar. Solo se lee directamente desde disco una ruta o un
+    archivo abierto con open(), nunca el nombre de un archivo subido, que
+    lo elige el navegador.
+    """
+    if isinstance(file, (str, os.PathLike)):
+        yield os.fspath(file)
+        return
+    if isinstance(file, (io.BufferedReader, io.FileIO)) and isinstance(file.name, str):
+        yield file.name
+        return
+
+    os.makedirs(UPLOADS_DIR, exist_ok=True)
+    descriptor, path = tempfile.mkstemp(suffix=".pdf", dir=UPLOADS_DIR)
+    try:
+        with os.fdopen(descriptor, "wb") as output:
+            if hasattr(file, "getbuffer"):
+                # Se escribe el buffer del BytesIO sin copiarlo
+                output.write(file.getbuffer())
+            else:
+                file.seek(0)
+                shutil.copyfileobj(file, output, 1024 * 1024)
+        yield path
+    finally:
+        os.remove(path)
+
+
+def extract_pdf_pages(
+    file: BinaryIO,
+    first_page: int = 0,
+    last_page: Optional[int] = None,
+    max_bytes: int = PDF_MAX_BYTES,
+    max_pages: int = PDF_MAX_PAGES,
+) -> List[str]:
+    """
+    Extrae el texto de cada página de un PDF. El archivo se lee desde disco
+    con memoria mapeada, por lo que la memoria usada no depende de su
+    tamaño. Los documentos largos se reparten en un pool de procesos.
+
+    Args:
+        file (BinaryIO): Archivo PDF, en memoria o en disco, o su ruta.
+        first_page (int): Primera página a extraer (desde 0).
+        last_page (int): Página donde se detiene la extracción (excluida).
+            Si es None se extrae hasta el final.
+        max_bytes (int): Tamaño máximo del archivo.
+        max_pages (int): Cantidad máxima de páginas a extraer.
+    Returns:
+        List[str]: Texto de cada página, en orden.
+    Raises:
+        PdfLimitError: Si el archivo supera max_bytes o max_pages.
+
+    Example:
+        >>> with open('documento.pdf', 'rb') as pdf_file:
+        ...     paginas = extract_pdf_pages(pdf_file, last_page=10)
+        >>> len(paginas)
+        10
+    """
+    size = _file_size(file)
+    if size > max_bytes:
+        raise PdfLimitError(
+            f"El PDF pesa {size / 2**20:.1f} MB y el máximo permitido es "
+            f"{max_bytes / 2**20:.0f} MB."
+        )
+
+    with _pdf_path(file) as path:
+        with _mapped_pdf(path) as reader:
+            total_pages = len(reader.pages)
+            start = max(first_page, 0)
+            stop = total_pages if last_page is None else min(last_page, total_pages)
+            if stop - start > max_pages:
+                raise PdfLimitError(
+                    f"El PDF tiene {stop - start} páginas y el máximo permitido "
+                    f"es {max_pages}."
+                )
+
+            if stop - start < PARALLEL_MIN_PAGES:
+                return [
+                    reader.pages[number].extract_text()
+                    for number in range(start, stop)
+                ]
+
+        # Los procesos del pool abren el archivo por su cuenta, así no se
+        # copia el PDF completo a cada tarea
+        tasks = [
+            (task_start, min(task_start + PAGES_PER_TASK, stop))
+            for task_start in range(start, stop, PAGES_PER_TASK)
+        ]
+        futures = _submit_tasks(path, tasks)
+        pages, retried = [], False
+        try:
+            for number in range(len(tasks)):
+                try:
+                    task_pages = futures[number].result()
+                except BrokenProcessPool:
+                    # Si murió un proceso del pool, por ejemplo por falta de
+                    # memoria, se reintentan una vez las tareas pendientes en
+                    # un pool nuevo
+                    if retried:
+                        raise
+                    retried = True
+                    futures[number:] = _submit_tasks(path, tasks[number:])
+                    task_pages = futures[number].result()
+                pages.extend(task_pages)
+        finally:
+            for future in futures:
+                future.cancel()
+        return pages
@@ -1,34 +1,250 @@
-import PyPDF2
+import hashlib
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
 from io import BytesIO, StringIO
 import markdown
 from xhtml2pdf import pisa
 import streamlit as st
+from streamlit.runtime.uploaded_file_manager import UploadedFile
 from models.question import (
     DevelopmentQuestion,
     MultipleChoiceQuestion,
     TrueFalseQuestion,
 )
-from typing import Union
+from typing import BinaryIO, List, Optional, Tuple, Union
+from utils.document_cache import file_digest, get_document, put_document
+from utils.metrics import span
+from utils.pdf_extraction import extract_pdf_pages
+from utils.retrieval import estimate_tokens
 
+# Una línea presente en esta fracción de las páginas se considera un
+# encabezado o pie de página
+REPEATED_LINE_MIN_FRACTION = 0.5
+# Documentos con menos páginas no se revisan en busca de líneas repetidas
+REPEATED_LINE_MIN_PAGES = 3
+# Solo las líneas cortas pueden ser encabezados o pies de página
+REPEATED_LINE_MAX_CHARS = 80
+# Líneas al comienzo y al final de cada página donde se buscan encabezados
+# y pies. Las líneas repetidas del cuerpo, como las de una tabla, se dejan
+REPEATED_LINE_EDGE_LINES = 2
 
-@st.cache_data
-def extract_text_from_pdf(file: BytesIO) -> str:
+_DIGITS = re.compile(r"\d+")
+_SPACES = re.compile(r"[ \t\u00a0]+")
+# Palabra cortada con guion al final de la línea y que sigue en minúscula
+_HYPHENATED = re.compile(r"(\w)-[ \t]*\n[ \t]*(?=[a-záéíóúüñ])")
+_PAGE_NUMBER = re.compile(
+    r"\W*(p[aá]g(ina)?\.?\s*)?\d+(\s*(/|de)\s*\d+)?\W*", flags=re.IGNORECASE
+)
+# Número de página dentro de un encabezado o pie, como "Página 3", "3 de 20"
+# o "Biología - 3". Un título como "Ejercicio 3" no lo es
+_PAGE_LABEL = re.compile(
+    r"(p[aá]g(ina)?|diapositiva)\.?\s*\d+|\d+\s*(/|de)\s*\d+"
+    r"|[-|·–—]\s*\d+\s*$|^\s*\d+\s*[-|·–—]",
+    flags=re.IGNORECASE,
+)
+
+# Cantidad máxima de PDFs de pruebas que se mantienen en memoria
+PDF_CACHE_MAX_ENTRIES = 32
+
+_pdf_cache: "OrderedDict[str, bytes]" = OrderedDict()
+_pdf_cache_lock = threading.Lock()
+
+# Estilos CSS básicos de las pruebas
+_TEST_STYLESHEET = """
+    body {
+        font-family: Arial, sans-serif;
+        line-height: 1.6;
+        margin: 1cm;
+    }
+    h1 {
+        font-size: 24px;
+        color: #2c3e50;
+        margin-bottom: 20px;
+    }
+    h3 {
+        font-size: 18px;
+        color: #34495e;
+        margin-top: 15px;
+        margin-bottom: 10px;
+    }
+    p {
+        font-size: 14px;
+        margin-bottom: 10px;
+    }
+"""
+
+# Página HTML con los estilos ya incluidos; solo falta insertar el cuerpo
+_TEST_PAGE_TEMPLATE = (
+    "<html><head><style>"
+    + _TEST_STYLESHEET.replace("%", "%%")
+    + "</style></head><body>%s</body></html>"
+)
+
+# Opciones de una pregunta de verdadero o falso en la versión sin respuestas
+_TRUE_FALSE_OPTIONS_HTML = markdown.markdown("\n- Verdadero\n\n\n- Falso\n\n")
+
+
+# Los archivos subidos se identifican por su ID para no recorrer su
+# contenido en cada ejecución de la página
+_UPLOAD_HASH_FUNCS = {UploadedFile: lambda file: file.file_id}
+
+
+@st.cache_resource(max_entries=32, hash_funcs=_UPLOAD_HASH_FUNCS)
+def get_file_digest(file: BinaryIO) -> str:
+    """
+    Devuelve el SHA-256 de un archivo, calculándolo una sola vez por archivo
+    subido.
+    """
+    return file_digest(file)
+
+
+# cache_resource entrega el mismo texto a todas las sesiones en vez de una
+# copia por ejecución de la página
+@st.cache_resource(max_entries=32, hash_funcs=_UPLOAD_HASH_FUNCS)
+def extract_text_from_pdf(
+    file: BinaryIO, first_page: int = 0, last_page: Optional[int] = None
+) -> str:
     """
     Lee el contenido de un archivo PDF y devuelve el texto extraído.
+    El texto de cada documento se guarda en un caché en disco, compartido
+    entre procesos, usando el SHA-256 del archivo como llave.
 
     Args:
-        file (file): Archivo PDF.
+        file (file): Archivo PDF, en memoria o abierto desde disco.
+        first_page (int): Primera página a extraer (desde 0).
+        last_page (int): Página donde se detiene la extracción (excluida).
     Returns:
         str: Texto extraído del archivo PDF.
+    Raises:
+        PdfLimitError: Si el PDF supera el tamaño o las páginas permitidas.
 
     Example:
         >>> with open('documento.pdf', 'rb') as pdf_file:
-        ...     contenido = extract_text_from_pdf(BytesIO(pdf_file.read()))
+        ...     contenido = extract_text_from_pdf(pdf_file)
         >>> print(contenido)
         'Este es el texto extraído del PDF...'
     """
-    pdf_reader = PyPDF2.PdfReader(file)
-    return " ".join(page.extract_text() for page in pdf_reader.pages)
+    with span("pdf_extraction", cached=False) as attributes:
+        digest = get_file_digest(file)
+        document = get_document(digest)
+        if document is not None:
+            attributes["cached"] = True
+            pages = document.pages(first_page, last_page)
+        elif first_page > 0 or last_page is not None:
+            pages = extract_pdf_pages(file, first_page, last_page)
+        else:
+            pages = put_document(digest, extract_pdf_pages(file)).pages()
+
+        # En el caché se guarda el texto original y se normaliza al leerlo
+        text = "\n".join(page for page in normalize_pages(pages) if page)
+        attributes.update(
+            pages=len(pages),
+            tokens_saved=estimate_tokens(" ".join(pages)) - estimate_tokens(text),
+        )
+        return text
+
+
+def normalize_pages(pages: List[str]) -> List[str]:
+    """
+    Limpia el texto extraído de cada página para no gastar tokens en él:
+    deja una sola vez los encabezados y pies que se repiten en las páginas,
+    elimina los números de página, une las palabras cortadas con guion al
+    final de una línea y colapsa los espacios y las líneas vacías.
+
+    Args:
+        pages (List[str]): Texto de cada página.
+    Returns:
+        List[str]: Texto normalizado de cada página.
+
+    Example:
+        >>> normalize_pages(
+        ...     ["Biología\nLa fotosín-\ntesis\n1", "Biología\nEl ciclo\n2",
+        ...      "Biología\nLas plantas\n3"]
+        ... )
+        ['Biología\nLa fotosíntesis', 'El ciclo', 'Las plantas']
+        >>> paginas = normalize_pages(
+        ...     [f"Biología\nPregunta {n}\nDatos\nSí\nNo\nSí\nNota {n}\n{n}"
+        ...      for n in range(1, 4)]
+        ... )
+        >>> paginas[1]
+        'Pregunta 2\nDatos\nSí\nNo\nSí\nNota 2'
+    """
+    pages_lines = [
+        [
+            line
+            for line in (
+                _SPACES.sub(" ", line).strip()
+                for line in _HYPHENATED.sub(r"\1", page).split("\n")
+            )
+            if line
+        ]
+        for page in pages
+    ]
+
+    # Líneas cortas al comienzo o al final de gran parte de las páginas. Si
+    # tienen un número de página como "Página 3 de 20", se ignoran los
+    # números que avanzan junto con la página
+    repeated = set()
+    if len(pages) >= REPEATED_LINE_MIN_PAGES:
+        line_pages = Counter(
+            key
+            for page_number, lines in enumerate(pages_lines)
+            for key in {
+                key
+                for position, line in enumerate(lines)
+                if _is_edge(position, lines) and len(line) <= REPEATED_LINE_MAX_CHARS
+                for key in _line_keys(line, page_number)
+            }
+        )
+        min_pages = max(
+            REPEATED_LINE_MIN_PAGES,
+            math.ceil(len(pages) * REPEATED_LINE_MIN_FRACTION),
+        )
+        repeated = {key for key, count in line_pages.items() if count >= min_pages}
+
+    # Cada encabezado o pie se deja solo en la primera página donde aparece.
+    # Las repeticiones dentro de una misma página no se eliminan
+    normalized, seen = [], set()
+    for page_number, lines in enumerate(pages_lines):
+        kept, page_keys = [], set()
+        for position, line in enumerate(lines):
+            keys = (
+                repeated.intersection(_line_keys(line, page_number))
+                if _is_edge(position, lines)
+                else None
+            )
+            if keys:
+                # Los números de página solos no se dejan ni una vez
+                if keys & seen or _PAGE_NUMBER.fullmatch(line):
+                    continue
+                page_keys.update(keys)
+            kept.append(line)
+        seen.update(page_keys)
+        normalized.append("\n".join(kept))
+    return normalized
+
+
+def _is_edge(position: int, lines: List[str]) -> bool:
+    return (
+        position < REPEATED_LINE_EDGE_LINES
+        or position >= len(lines) - REPEATED_LINE_EDGE_LINES
+    )
+
+
+def _line_keys(line: str, page_number: int) -> List[tuple]:
+    # La línea tal cual y, si tiene un número de página, la línea con cada
+    # número reemplazado por su diferencia con el número de página, que es
+    # la misma en todas las páginas para un número de página real
+    keys = [(line.lower(),)]
+    if _PAGE_NUMBER.fullmatch(line) or _PAGE_LABEL.search(line):
+        pattern = _DIGITS.sub("#", line.lower())
+        keys.extend(
+            (pattern, index, int(number) - page_number)
+            for index, number in enumerate(_DIGITS.findall(line))
+        )
+    return keys
 
 
 def format_question_to_markdown(
@@ -133,6 +349,74 @@ def generate_test_markdown_without_answers(selected_questions: list, topic: str)
     return "\n".join([title] + questions)
 
 
+def build_test_html(selected_questions: list, topic: str) -> Tuple[str, str]:
+    """
+    Genera el cuerpo HTML de una prueba con y sin respuestas en una sola
+    pasada. Los fragmentos comunes a ambas versiones (título, enunciados y
+    alternativas) se convierten desde Markdown una sola vez.
+
+    Args:
+        selected_questions (list): Lista de preguntas seleccionadas.
+        topic (str): Tema de la prueba.
+    Returns:
+        Tuple[str, str]: HTML con respuestas y HTML sin respuestas.
+    """
+    md = markdown.Markdown()
+
+    def to_html(text: str) -> str:
+        return md.reset().convert(text)
+
+    title = to_html(f"# Prueba sobre {topic}")
+    with_answers, without_answers = [title], [title]
+    for idx, question in enumerate(selected_questions):
+        statement = to_html(f"### Pregunta {idx + 1}\n### {question.pregunta}")
+        answer = to_html(f"Respuesta: {question.respuesta}")
+        with_answers.extend([statement, answer])
+        without_answers.append(statement)
+
+        if isinstance(question, MultipleChoiceQuestion):
+            alternatives = to_html(
+                "\n\n".join(
+                    f"Opción {chr(65+i)}: {alt}"
+                    for i, alt in enumerate(question.alternativas)
+                )
+            )
+            with_answers.append(alternatives)
+            without_answers.append(alternatives)
+        elif isinstance(question, TrueFalseQuestion):
+            without_answers.append(_TRUE_FALSE_OPTIONS_HTML)
+    return "\n".join(with_answers), "\n".join(without_answers)
+
+
+def render_test_pdfs(selected_questions: list, topic: str) -> Tuple[bytes, bytes]:
+    """
+    Genera los PDFs de una prueba con y sin respuestas a partir del mismo
+    HTML intermedio y la misma hoja de estilos.
+
+    Args:
+        selected_questions (list): Lista de preguntas seleccionadas.
+        topic (str): Tema de la prueba.
+    Returns:
+        Tuple[bytes, bytes]: PDF con respuestas y PDF sin respuestas.
+    """
+    with span("test_html", questions=len(selected_questions)):
+        html_with_answers, html_without_answers = build_test_html(
+            selected_questions, topic
+        )
+    return (
+        _render_pdf(html_with_answers).getvalue(),
+        _render_pdf(html_without_answers).getvalue(),
+    )
+
+
+def _render_pdf(html_content: str) -> BytesIO:
+    pdf_output = BytesIO()
+    with span("pdf_rendering"):
+        pisa.CreatePDF(StringIO(_TEST_PAGE_TEMPLATE % html_content), dest=pdf_output)
+    pdf_output.seek(0)
+    return pdf_output
+
+
 def convert_test_to_pdf(selected_questions: list, topic: str) -> BytesIO:
     """
     Genera un archivo PDF a partir del texto Markdown de una prueba,
@@ -155,47 +439,7 @@ def convert_test_to_pdf(selected_questions: list, topic: str) -> BytesIO:
         >>> with open('prueba.pdf', 'wb') as f:
         ...     f.write(pdf_bytes.getvalue())
     """
-    markdown_content = generate_test_markdown(selected_questions, topic)
-    html_content = markdown.markdown(markdown_content)
-
-    # Definir estilos CSS básicos
-    css_styles = """
-        <style>
-            body {
-                font-family: Arial, sans-serif;
-                line-height: 1.6;
-                margin: 1cm;
-            }
-            h1 {
-                font-size: 24px;
-                color: #2c3e50;
-                margin-bottom: 20px;
-            }
-            h3 {
-                font-size: 18px;
-                color: #34495e;
-                margin-top: 15px;
-                margin-bottom: 10px;
-            }
-            p {
-                font-size: 14px;
-                margin-bottom: 10px;
-            }
-        </style>
-    """
-
-    # Combinar estilos con el contenido HTML
-    html_with_styles = f"""
-        <html>
-            <head>{css_styles}</head>
-            <body>{html_content}</body>
-        </html>
-    """
-
-    pdf_output = BytesIO()
-    pisa.CreatePDF(StringIO(html_with_styles), dest=pdf_output)
-    pdf_output.seek(0)
-    return pdf_output
+    return _render_pdf(build_test_html(selected_questions, topic)[0])
 
 
 def convert_test_to_pdf_without_answers(
@@ -204,42 +448,71 @@ def convert_test_to_pdf_without_answers(
     """
     Genera un archivo PDF de la prueba sin incluir las respuestas.
     """
-    markdown_content = generate_test_markdown_without_answers(selected_questions, topic)
-    html_content = markdown.markdown(markdown_content)
+    return _render_pdf(build_test_html(selected_questions, topic)[1])
 
-    css_styles = """
-        <style>
-            body {
-                font-family: Arial, sans-serif;
-                line-height: 1.6;
-                margin: 1cm;
-            }
-            h1 {
-                font-size: 24px;
-                color: #2c3e50;
-                margin-bottom: 20px;
-            }
-            h3 {
-                font-size: 18px;
-                color: #34495e;
-                margin-top: 15px;
-                margin-bottom: 10px;
-            }
-            p {
-                font-size: 14px;
-                margin-bottom: 10px;
-            }
-        </style>
+
+def fingerprint_test(
+    selected_questions: list, topic: str, with_answers: bool = True
+) -> str:
     """
+    Calcula una huella del contenido de una prueba para usarla como llave
+    de caché.
 
-    html_with_styles = f"""
-        <html>
-            <head>{css_styles}</head>
-            <body>{html_content}</body>
-        </html>
+    Args:
+        selected_questions (list): Lista de preguntas seleccionadas.
+        topic (str): Tema de la prueba.
+        with_answers (bool): Si la versión incluye las respuestas.
+    Returns:
+        str: Hash SHA-256 en hexadecimal.
     """
+    digest = hashlib.sha256()
+    digest.update(("con" if with_answers else "sin").encode())
+    digest.update(b"\x00")
+    digest.update(topic.encode())
+    for question in selected_questions:
+        digest.update(b"\x00")
+        digest.update(type(question).__name__.encode())
+        digest.update(question.model_dump_json().encode())
+    return digest.hexdigest()
 
-    pdf_output = BytesIO()
-    pisa.CreatePDF(StringIO(html_with_styles), dest=pdf_output)
-    pdf_output.seek(0)
-    return pdf_output
+
+def get_test_pdf(
+    selected_questions: list, topic: str, with_answers: bool = True
+) -> bytes:
+    """
+    Devuelve el PDF de una prueba, reutilizando la versión ya generada si
+    el contenido no ha cambiado. Los PDFs se guardan en un caché LRU de
+    tamaño acotado por PDF_CACHE_MAX_ENTRIES.
+
+    Args:
+        selected_questions (list): Lista de preguntas seleccionadas.
+        topic (str): Tema de la prueba.
+        with_answers (bool): Si la versión incluye las respuestas.
+    Returns:
+        bytes: Contenido del archivo PDF.
+
+    Example:
+        >>> pdf = get_test_pdf(preguntas, 'Geografía', with_answers=False)
+        >>> pdf is get_test_pdf(preguntas, 'Geografía', with_answers=False)
+        True
+    """
+    key = fingerprint_test(selected_questions, topic, with_answers)
+    with _pdf_cache_lock:
+        if key in _pdf_cache:
+            _pdf_cache.move_to_end(key)
+            return _pdf_cache[key]
+
+    # Ambas versiones se generan juntas, así la segunda descarga es inmediata
+    pdf_with_answers, pdf_without_answers = render_test_pdfs(selected_questions, topic)
+    rendered = {
+        fingerprint_test(selected_questions, topic, True): pdf_with_answers,
+        fingerprint_test(selected_questions, topic, False): pdf_without_answers,
+    }
+
+    with _pdf_cache_lock:
+        for rendered_key, pdf_bytes in rendered.items():
+            _pdf_cache[rendered_key] = pdf_bytes
+            _pdf_cache.move_to_end(rendered_key)
+        while len(_pdf_cache) > PDF_CACHE_MAX_ENTRIES:
+            _pdf_cache.popitem(last=False)
+    return rendered[key]
@@ -0,0 +1,181 @@
+import time
+from typing import List, Optional, Sequence, Union
+
+from models.question import (
+    DevelopmentQuestion,
+    MultipleChoiceQuestion,
+    TrueFalseQuestion,
+)
+from utils.question_generation import QUESTION_MODELS, question_type_name
+from utils.retrieval import tokenize
+from utils.storage import DATA_DIR, connect
+
+# Cantidad máxima de preguntas devueltas por una búsqueda
+QUESTION_BANK_SEARCH_LIMIT = 20
+
+_DATABASE = "question_bank.sqlite3"
+
+
+def _connect():
+    connection = connect(_DATABASE, directory=DATA_DIR)
+    connection.executescript("""
+        CREATE TABLE IF NOT EXISTS questions (
+            id INTEGER PRIMARY KEY,
+            question_type TEXT NOT NULL,
+            pregunta TEXT NOT NULL,
+            details TEXT NOT NULL,
+            data TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            difficulty TEXT NOT NULL,
+            source_digest TEXT,
+            created_at REAL NOT NULL,
+            UNIQUE (question_type, pregunta)
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5 (
+            topic,
+            pregunta,
+            details,
+            content = 'questions',
+            content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2'
+        );
+        CREATE TRIGGER IF NOT EXISTS questions_insert AFTER INSERT ON questions
+        BEGIN
+            INSERT INTO questions_fts (rowid, topic, pregunta, details)
+            VALUES (new.id, new.topic, new.pregunta, new.details);
+        END;
+        CREATE TRIGGER IF NOT EXISTS questions_delete AFTER DELETE ON questions
+        BEGIN
+            INSERT INTO questions_fts (questions_fts, rowid, topic, pregunta, details)
+            VALUES ('delete', old.id, old.topic, old.pregunta, old.details);
+        END;
+        CREATE TRIGGER IF NOT EXISTS questions_update AFTER UPDATE ON questions
+        BEGIN
+            INSERT INTO questions_fts (questions_fts, rowid, topic, pregunta, details)
+            VALUES ('delete', old.id, old.topic, old.pregunta, old.details);
+            INSERT INTO questions_fts (rowid, topic, pregunta, details)
+            VALUES (new.id, new.topic, new.pregunta, new.details);
+        END;
+        """)
+    return connection
+
+
+def save_questions(
+    questions: Sequence[
+        Union[DevelopmentQuestion, MultipleChoiceQuestion, TrueFalseQuestion]
+    ],
+    topic: str,
+    difficulty: str,
+    source_digest: Optional[str] = None,
+) -> int:
+    """
+    Guarda preguntas en el banco. Si ya existe una pregunta del mismo tipo
+    con el mismo enunciado, se actualizan su respuesta y sus datos.
+
+    Args:
+        questions: Preguntas a guardar.
+        topic (str): Tema de la evaluación.
+        difficulty (str): Dificultad de las preguntas.
+        source_digest (str): SHA-256 del PDF en que se basaron las preguntas.
+    Returns:
+        int: Cantidad de preguntas guardadas.
+    """
+    now = time.time()
+    rows = [
+        (
+            question_type_name(question),
+            question.pregunta,
+            " ".join([question.respuesta] + getattr(question, "alternativas", [])),
+            question.model_dump_json(),
+            topic,
+            difficulty,
+            source_digest,
+            now,
+        )
+        for question in questions
+    ]
+    connection = _connect()
+    try:
+        with connection:
+            connection.executemany(
+                """
+                INSERT INTO questions (
+                    question_type, pregunta, details, data, topic, difficulty,
+                    source_digest, created_at
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (question_type, pregunta) DO UPDATE SET
+                    details = excluded.details,
+                    data = excluded.data,
+                    topic = excluded.topic,
+                    difficulty = excluded.difficulty,
+                    source_digest = COALESCE(excluded.source_digest, source_digest)
+                """,
+                rows,
+            )
+    finally:
+        connection.close()
+    return len(rows)
+
+
+def search_questions(
+    query: str,
+    question_types: Optional[Sequence[str]] = None,
+    difficulty: Optional[str] = None,
+    source_digest: Optional[str] = None,
+    limit: int = QUESTION_BANK_SEARCH_LIMIT,
+) -> List[Union[DevelopmentQuestion, MultipleChoiceQuestion, TrueFalseQuestion]]:
+    """
+    Busca preguntas guardadas cuyo tema o contenido coincida con la
+    consulta. Las preguntas basadas en el mismo PDF aparecen primero.
+
+    Args:
+        query (str): Texto a buscar, por ejemplo el tema de la evaluación.
+        question_types (Sequence[str]): Tipos de pregunta permitidos, o None
+            para todos.
+        difficulty (str): Dificultad exigida, o None para cualquiera.
+        source_digest (str): SHA-256 del PDF de la clase actual.
+        limit (int): Cantidad máxima de preguntas.
+    Returns:
+        List: Preguntas encontradas, de la más a la menos relevante.
+
+    Example:
+        >>> search_questions("Fotosíntesis", ["Alternativas"], "Intermedio")
+    """
+    terms = tokenize(query)
+    if not terms:
+        return []
+    # Cada término se busca como prefijo para cubrir plurales y derivados
+    match = " OR ".join(f'"{term}"*' for term in dict.fromkeys(terms))
+
+    sql = """
+        SELECT questions.question_type, questions.data
+        FROM questions_fts
+        JOIN questions ON questions.id = questions_fts.rowid
+        WHERE questions_fts MATCH ?
+    """
+    params = [match]
+    if question_types is not None:
+        placeholders = ", ".join("?" * len(question_types))
+        sql += f" AND questions.question_type IN ({placeholders})"
+        params.extend(question_types)
+    if difficulty is not None:
+        sql += " AND questions.difficulty = ?"
+        params.append(difficulty)
+    sql += """
+        ORDER BY
+            COALESCE(questions.source_digest = ?, 0) DESC,
+            bm25(questions_fts, 2.0, 1.0, 0.5)
+        LIMIT ?
+    """
+    params.extend([source_digest, limit])
+
+    connection = _connect()
+    try:
+        rows = connection.execute(sql, params).fetchall()
+    finally:
+        connection.close()
+    return [
+        QUESTION_MODELS[question_type].model_validate_json(data)
+        for question_type, data in rows
+    ]
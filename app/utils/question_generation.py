@@ -0,0 +1,580 @@
+import json
+import math
+from typing import Dict, List, Sequence, Tuple, Union
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable, RunnableLambda
+from pydantic import ValidationError
+
+from models.question import (
+    DevelopmentQuestion,
+    DevelopmentQuestionList,
+    MultipleChoiceQuestion,
+    MultipleChoiceQuestionList,
+    TrueFalseQuestion,
+    TrueFalseQuestionList,
+)
+from utils.dedup import QuestionIndex
+from utils.llm_cache import forget_responses, track_responses
+from utils.llm_clients import get_setting
+from utils.metrics import get_metrics_callback, span
+from utils.retrieval import (
+    CONTEXT_STABLE_TOKEN_BUDGET,
+    CONTEXT_TOKEN_BUDGET,
+    CONTEXT_TOP_K,
+    BM25Index,
+    split_context,
+)
+
+# Veces que se piden de nuevo solo las preguntas faltantes o inválidas de
+# una respuesta
+MAX_TOP_UP_REQUESTS = 2
+# Preguntas máximas por llamada al modelo. Los pedidos más grandes se
+# reparten en llamadas paralelas, porque la latencia crece con la salida
+QUESTIONS_PER_SHARD = 5
+
+# Plantilla para el sistema. Solo contiene la bibliografía y las preguntas
+# tipo, que no cambian al regenerar sobre la misma clase, para que el
+# proveedor reutilice el prefijo del prompt desde su caché. Todo lo que
+# varía entre pedidos va en el mensaje del usuario
+system_template_message = """
+Eres un profesor experto en crear evaluaciones.
+
+Basado en tu conocimiento y en la bibliografía:
+{bibliography}
+
+en las siguientes preguntas realizadas anteriormente:
+{sample_questions}
+
+tienes que crear una evaluación según las especificaciones dadas
+por el profesor.
+
+"""
+
+fragmentos_relevantes = """
+Estos fragmentos de la bibliografía son los más relacionados con este pedido:
+{fragments}
+"""
+
+comentarios_adicionales = """
+Considera estos comentarios adicionales al crear las preguntas:
+{comments}
+"""
+
+preguntas_excluidas = """
+No repitas ni reformules estas preguntas, que ya fueron generadas antes:
+{excluded_questions}
+"""
+
+enfoque_parte = """
+Basa estas preguntas principalmente en la parte de la bibliografía que
+comienza así:
+"{focus}"
+"""
+
+user_template_message = """
+Crea {question_quantity} preguntas de tipo {question_type}
+sobre el tema {topic} basandote en la bibliografía.
+Las preguntas deben tener dificultad {difficulty}.
+"""
+
+output_desarrollo_template = """
+Genera preguntas de desarrollo.
+El output debe ser un objeto JSON con la siguiente estructura:
+{{
+    "list_questions_answers": {{
+        "questions_answers": [
+            {{"pregunta": "¿Cuál es la capital de Francia?", "respuesta": "París"}},
+            {{"pregunta": "Explica el proceso de fotosíntesis", "respuesta": "La fotosíntesis es..."}}
+        ]
+    }}
+}}
+"""
+
+output_alternativas_template = """
+Genera preguntas de alternativas.
+El output debe ser un objeto JSON con la siguiente estructura:
+{{
+    "list_questions_answers": {{
+        "questions_answers": [
+            {{
+                "pregunta": "¿Cuál es la capital de Francia?",
+                "respuesta": "París",
+                "alternativas": ["París", "Londres", "Berlín", "Madrid", "Roma"]
+            }}
+        ]
+    }}
+}}
+"""
+
+output_verdadero_falso_template = """
+Genera preguntas de verdadero o falso.
+El output debe ser un objeto JSON con la siguiente estructura:
+{{
+    "list_questions_answers": {{
+        "questions_answers": [
+            {{"pregunta": "París es la capital de Francia", "respuesta": "Verdadero"}},
+            {{"pregunta": "Londres es la capital de Francia", "respuesta": "Falso"}}
+        ]
+    }}
+}}
+"""
+
+
+# Función extraer preguntas y respuestas
+def parse_question_jsons(
+    questions_answers_list: (
+        DevelopmentQuestionList | MultipleChoiceQuestionList | TrueFalseQuestionList
+    ),
+):
+    return questions_answers_list.questions_answers
+
+
+# Template de salida y modelo estructurado para cada tipo de pregunta
+QUESTION_TYPES = {
+    "Alternativas": (output_alternativas_template, MultipleChoiceQuestionList),
+    "Desarrollo": (output_desarrollo_template, DevelopmentQuestionList),
+    "Verdadero y Falso": (output_verdadero_falso_template, TrueFalseQuestionList),
+}
+
+# Modelo de cada pregunta individual según su tipo
+QUESTION_MODELS = {
+    "Alternativas": MultipleChoiceQuestion,
+    "Desarrollo": DevelopmentQuestion,
+    "Verdadero y Falso": TrueFalseQuestion,
+}
+
+
+def question_type_name(
+    question: Union[DevelopmentQuestion, MultipleChoiceQuestion, TrueFalseQuestion],
+) -> str:
+    """
+    Devuelve el tipo de una pregunta con el nombre que se muestra en la app.
+
+    Args:
+        question: Pregunta de cualquier tipo.
+    Returns:
+        str: Llave de QUESTION_TYPES, por ejemplo "Alternativas".
+    """
+    for question_type, question_model in QUESTION_MODELS.items():
+        if isinstance(question, question_model):
+            return question_type
+    raise ValueError(f"Tipo de pregunta desconocido: {type(question).__name__}")
+
+
+def build_question_chain(
+    llm: BaseChatModel,
+    question_type: str,
+    extra_comments: str = "",
+    excluded_questions: Sequence[str] = (),
+    focus: str = "",
+) -> Runnable:
+    """
+    Construye la cadena prompt -> modelo estructurado para un tipo de
+    pregunta.
+
+    Args:
+        llm (BaseChatModel): Modelo de lenguaje.
+        question_type (str): Tipo de pregunta, una llave de QUESTION_TYPES.
+        extra_comments (str): Comentarios adicionales del profesor.
+        excluded_questions (Sequence[str]): Preguntas que no se deben repetir.
+        focus (str): Inicio de la parte de la bibliografía en que se deben
+            basar las preguntas, ver focus_hints.
+    Returns:
+        Runnable: Cadena que recibe el input del prompt y devuelve un
+            diccionario con la respuesta del modelo ("raw"), la lista
+            estructurada de preguntas ("parsed") y el error de lectura
+            ("parsing_error"), si lo hubo.
+    """
+    output_template, question_list_model = QUESTION_TYPES[question_type]
+
+    # El tipo de salida, los fragmentos relevantes para el pedido, los
+    # comentarios y las preguntas excluidas van después de la bibliografía,
+    # en el mensaje del usuario
+    complete_user_template_message = output_template + "{relevant_bibliography}"
+    if extra_comments:
+        complete_user_template_message += "\n" + comentarios_adicionales.format(
+            comments=extra_comments
+        )
+    if excluded_questions:
+        complete_user_template_message += "\n" + preguntas_excluidas
+    if focus:
+        complete_user_template_message += "\n" + enfoque_parte
+    complete_user_template_message += "\n" + user_template_message
+
+    prompt_template = ChatPromptTemplate.from_messages(
+        messages=[
+            ("system", system_template_message),
+            ("user", complete_user_template_message),
+        ]
+    )
+    # Sin fragmentos relevantes, como cuando la bibliografía completa cabe
+    # en el mensaje del sistema, no se agrega nada
+    prompt_template = prompt_template.partial(relevant_bibliography="")
+    if excluded_questions:
+        prompt_template = prompt_template.partial(
+            excluded_questions="\n".join(f"- {text}" for text in excluded_questions)
+        )
+    if focus:
+        prompt_template = prompt_template.partial(focus=focus)
+    # Con include_raw un elemento mal formado no descarta la respuesta
+    # completa: se recuperan las preguntas válidas desde la respuesta cruda
+    return prompt_template | llm.with_structured_output(
+        question_list_model, include_raw=True
+    )
+
+
+def bibliography_input(index: BM25Index, query: str) -> dict:
+    """
+    Prepara las variables del prompt con la bibliografía de un pedido. El
+    mensaje del sistema lleva una parte de la bibliografía que no depende
+    del pedido, así su prefijo se reutiliza desde el caché del proveedor al
+    cambiar el tema o los comentarios. Los fragmentos relevantes para el
+    pedido van en el mensaje del usuario.
+
+    Args:
+        index (BM25Index): Índice de la bibliografía.
+        query (str): Tema, comentarios y tipos de pregunta del pedido.
+    Returns:
+        dict: Variables "bibliography" y "relevant_bibliography".
+
+    Example:
+        >>> prompt_input = {**prompt_input, **bibliography_input(index, query)}
+    """
+    stable, relevant = split_context(
+        index,
+        query,
+        top_k=get_setting("CONTEXT_TOP_K", CONTEXT_TOP_K),
+        token_budget=get_setting("CONTEXT_TOKEN_BUDGET", CONTEXT_TOKEN_BUDGET),
+        stable_budget=get_setting(
+            "CONTEXT_STABLE_TOKEN_BUDGET", CONTEXT_STABLE_TOKEN_BUDGET
+        ),
+    )
+    return {
+        "bibliography": stable,
+        "relevant_bibliography": (
+            "\n" + fragmentos_relevantes.format(fragments=relevant) if relevant else ""
+        ),
+    }
+
+
+def question_problems(
+    question: Union[DevelopmentQuestion, MultipleChoiceQuestion, TrueFalseQuestion],
+) -> List[str]:
+    """
+    Revisa las condiciones que debe cumplir una pregunta además de su
+    esquema.
+
+    Args:
+        question: Pregunta de cualquier tipo.
+    Returns:
+        List[str]: Problemas encontrados, vacía si la pregunta es válida.
+
+    Example:
+        >>> question_problems(
+        ...     MultipleChoiceQuestion(
+        ...         pregunta="¿Capital de Francia?",
+        ...         respuesta="París",
+        ...         alternativas=["Roma", "Berlín"],
+        ...     )
+        ... )
+        ['la respuesta no está entre las alternativas']
+    """
+    problems = []
+    if not question.pregunta.strip():
+        problems.append("la pregunta está vacía")
+    if not question.respuesta.strip():
+        problems.append("la respuesta está vacía")
+    if isinstance(question, MultipleChoiceQuestion):
+        alternatives = [
+            alternative.strip().casefold() for alternative in question.alternativas
+        ]
+        if len(set(alternatives)) < 2:
+            problems.append("tiene menos de dos alternativas distintas")
+        elif len(set(alternatives)) < len(alternatives):
+            problems.append("tiene alternativas repetidas")
+        if question.respuesta.strip().casefold() not in alternatives:
+            problems.append("la respuesta no está entre las alternativas")
+    return problems
+
+
+def _raw_question_items(message: AIMessage) -> list:
+    """
+    Devuelve los elementos de la lista de preguntas de la respuesta cruda
+    del modelo, aunque no cumplan el esquema.
+    """
+    calls = [tool_call["args"] for tool_call in message.tool_calls]
+    # Llamadas cuyo JSON no se pudo leer completo
+    for tool_call in message.invalid_tool_calls:
+        try:
+            calls.append(json.loads(tool_call.get("args") or ""))
+        except ValueError:
+            continue
+    arguments = calls[0] if calls else {}
+    items = arguments.get("questions_answers") if isinstance(arguments, dict) else []
+    return items if isinstance(items, list) else []
+
+
+def salvage_questions(question_type: str, output: dict) -> Tuple[list, int]:
+    """
+    Conserva las preguntas válidas de una respuesta del modelo, aunque otros
+    elementos de la lista no cumplan el esquema o las condiciones de
+    question_problems.
+
+    Args:
+        question_type (str): Tipo de pregunta pedido.
+        output (dict): Salida de la cadena de build_question_chain.
+    Returns:
+        Tuple[list, int]: Preguntas válidas y cantidad de descartadas.
+    """
+    if output.get("parsed") is not None:
+        items = parse_question_jsons(output["parsed"])
+    else:
+        items = _raw_question_items(output["raw"])
+
+    question_model = QUESTION_MODELS[question_type]
+    questions, invalid = [], 0
+    for item in items:
+        try:
+            question = (
+                item
+                if isinstance(item, question_model)
+                else question_model.model_validate(item)
+            )
+        except ValidationError:
+            invalid += 1
+            continue
+        if question_problems(question):
+            invalid += 1
+            continue
+        questions.append(question)
+    return questions, invalid
+
+
+def _generate_shard(
+    llm: BaseChatModel,
+    question_type: str,
+    prompt_input: dict,
+    extra_comments: str = "",
+    excluded_questions: Sequence[str] = (),
+    focus: str = "",
+) -> list:
+    """
+    Genera preguntas de un solo tipo en una llamada al modelo. Se conservan
+    las preguntas válidas de cada respuesta y, si faltan, se piden solo las
+    que faltan, hasta MAX_TOP_UP_REQUESTS veces. Puede devolver menos
+    preguntas que las pedidas.
+
+    Raises:
+        ValueError: Si ninguna respuesta del modelo tuvo preguntas válidas.
+    """
+    quantity = prompt_input.get("question_quantity")
+    with span(
+        "question_generation", question_type=question_type, quantity=quantity
+    ) as attributes:
+        questions, invalid, requests, parsing_error = [], 0, 0, None
+        while len(questions) < quantity and requests <= MAX_TOP_UP_REQUESTS:
+            missing = quantity - len(questions)
+            requests += 1
+            # Las preguntas ya aceptadas se excluyen para no recibirlas de nuevo
+            excluded = list(excluded_questions) + [
+                question.pregunta for question in questions
+            ]
+            chain = build_question_chain(
+                llm, question_type, extra_comments, excluded, focus
+            )
+            try:
+                # El callback mide también el armado del prompt y la lectura de
+                # la salida
+                with track_responses() as responses:
+                    output = chain.invoke(
+                        {
+                            **prompt_input,
+                            "question_type": question_type,
+                            "question_quantity": missing,
+                        },
+                        config={"callbacks": [get_metrics_callback()]},
+                    )
+            except Exception:
+                # Si falla un pedido de preguntas faltantes se entregan las
+                # que ya se tienen
+                if not questions:
+                    raise
+                break
+            valid, discarded = salvage_questions(question_type, output)
+            if not valid:
+                # Una respuesta sin preguntas válidas no se deja en el caché:
+                # el reintento, que tiene el mismo prompt, y los próximos
+                # pedidos iguales vuelven a consultar al modelo
+                forget_responses(responses)
+            questions.extend(valid[:missing])
+            invalid += discarded
+            parsing_error = output.get("parsing_error") or parsing_error
+
+        attributes.update(requests=requests, invalid=invalid, generated=len(questions))
+        if quantity and not questions:
+            raise ValueError(
+                "El modelo no entregó preguntas válidas"
+                + (f": {parsing_error}" if parsing_error else ".")
+            )
+        return questions
+
+
+def shard_sizes(quantity: int, per_shard: int = QUESTIONS_PER_SHARD) -> List[int]:
+    """
+    Reparte una cantidad de preguntas en partes de a lo más per_shard, de
+    tamaños lo más parejos posible.
+
+    Example:
+        >>> shard_sizes(12)
+        [4, 4, 4]
+    """
+    shards = max(1, math.ceil(quantity / per_shard))
+    base, extra = divmod(quantity, shards)
+    return [base + 1] * extra + [base] * (shards - extra)
+
+
+def generate_questions(
+    llm: BaseChatModel,
+    question_type: str,
+    prompt_input: dict,
+    extra_comments: str = "",
+    excluded_questions: Sequence[str] = (),
+    focus_hints: Sequence[str] = (),
+) -> list:
+    """
+    Genera preguntas de un solo tipo. Los pedidos de más de
+    QUESTIONS_PER_SHARD preguntas se reparten en llamadas paralelas, cada
+    una enfocada en una parte distinta de la bibliografía, y luego se
+    descartan las preguntas repetidas entre ellas. Si faltan preguntas se
+    piden solo las que faltan. Puede devolver menos preguntas que las
+    pedidas.
+
+    Args:
+        llm (BaseChatModel): Modelo de lenguaje.
+        question_type (str): Tipo de pregunta.
+        prompt_input (dict): Variables del prompt.
+        extra_comments (str): Comentarios adicionales del profesor.
+        excluded_questions (Sequence[str]): Preguntas que no se deben repetir.
+        focus_hints (Sequence[str]): Partes de la bibliografía en que se
+            enfoca cada llamada, ver retrieval.focus_hints.
+    Returns:
+        list: Preguntas generadas.
+    Raises:
+        ValueError: Si ninguna respuesta del modelo tuvo preguntas válidas.
+    """
+    quantity = prompt_input.get("question_quantity")
+    sizes = shard_sizes(quantity)
+    if len(sizes) == 1:
+        return _generate_shard(
+            llm, question_type, prompt_input, extra_comments, excluded_questions
+        )
+
+    with span(
+        "sharded_question_generation", question_type=question_type, shards=len(sizes)
+    ) as attributes:
+        shards = [
+            (size, focus_hints[number] if number < len(focus_hints) else "")
+            for number, size in enumerate(sizes)
+        ]
+        results = RunnableLambda(
+            lambda shard: _generate_shard(
+                llm,
+                question_type,
+                {**prompt_input, "question_quantity": shard[0]},
+                extra_comments,
+                excluded_questions,
+                shard[1],
+            )
+        ).batch(shards, return_exceptions=True)
+
+        # Unir las partes descartando las preguntas repetidas entre ellas
+        index = QuestionIndex()
+        questions, errors, duplicates = [], [], 0
+        for result in results:
+            if isinstance(result, Exception):
+                errors.append(result)
+                continue
+            unique, discarded = index.filter_new(result)
+            questions.extend(unique)
+            duplicates += discarded
+        if not questions:
+            raise errors[0]
+
+        # Pedir las que faltan por partes fallidas o repetidas. Si falla, se
+        # entregan las que ya se tienen y el error queda en las métricas
+        missing = quantity - len(questions)
+        if missing > 0:
+            try:
+                extra = _generate_shard(
+                    llm,
+                    question_type,
+                    {**prompt_input, "question_quantity": missing},
+                    extra_comments,
+                    list(excluded_questions)
+                    + [question.pregunta for question in questions],
+                )
+                questions.extend(index.filter_new(extra)[0])
+            except Exception as e:
+                attributes.update(top_up_error=f"{type(e).__name__}: {e}")
+        attributes.update(
+            failed_shards=len(errors), duplicates=duplicates, generated=len(questions)
+        )
+        return questions[:quantity]
+
+
+def generate_mixed_questions(
+    llm: BaseChatModel,
+    question_counts: Dict[str, int],
+    prompt_input: dict,
+    extra_comments: str = "",
+    excluded_questions: Sequence[str] = (),
+    focus_hints: Sequence[str] = (),
+) -> Tuple[list, List[Tuple[str, Exception]]]:
+    """
+    Genera preguntas de varios tipos a la vez. Cada tipo se genera de forma
+    independiente y todos se ejecutan en paralelo.
+
+    Args:
+        llm (BaseChatModel): Modelo de lenguaje.
+        question_counts (Dict[str, int]): Cantidad de preguntas por tipo.
+        prompt_input (dict): Variables del prompt, sin el tipo ni la cantidad.
+        extra_comments (str): Comentarios adicionales del profesor.
+        excluded_questions (Sequence[str]): Preguntas que no se deben repetir.
+        focus_hints (Sequence[str]): Partes de la bibliografía en que se
+            enfocan las llamadas de cada tipo.
+    Returns:
+        Tuple[list, List[Tuple[str, Exception]]]: Preguntas generadas en el
+            orden de question_counts y errores de los tipos que fallaron.
+
+    Example:
+        >>> preguntas, errores = generate_mixed_questions(
+        ...     llm, {"Alternativas": 5, "Desarrollo": 2}, prompt_input
+        ... )
+    """
+    requests = [
+        (question_type, quantity)
+        for question_type, quantity in question_counts.items()
+        if quantity > 0
+    ]
+    with span("mixed_question_generation", types=len(requests)):
+        results = RunnableLambda(
+            lambda request: generate_questions(
+                llm,
+                request[0],
+                {**prompt_input, "question_quantity": request[1]},
+                extra_comments,
+                excluded_questions,
+                focus_hints,
+            )
+        ).batch(requests, return_exceptions=True)
+
+    questions, errors = [], []
+    for (question_type, _), result in zip(requests, results):
+        if isinstance(result, Exception):
+            errors.append((question_type, result))
+        else:
+            questions.extend(result)
+    return questions, errors
@@ -0,0 +1,280 @@
+import heapq
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Mapping, Optional
+
+import httpx
+
+from utils.metrics import record
+from utils.retrieval import estimate_tokens
+
+# Cuota de la cuenta de OpenAI por modelo. Se pueden sobrescribir con
+# variables de entorno o en secrets.toml usando el mismo nombre.
+LLM_REQUESTS_PER_MINUTE = 500
+LLM_TOKENS_PER_MINUTE = 200_000
+# Tokens de salida que se reservan si la solicitud no indica un máximo
+LLM_COMPLETION_TOKENS_ESTIMATE = 1000
+# Veces que se reintenta una solicitud rechazada por límite de uso
+LLM_RATE_LIMIT_RETRIES = 5
+# Espera máxima entre reintentos cuando la respuesta no indica cuánto esperar
+LLM_MAX_BACKOFF_SECONDS = 60.0
+
+# Prioridades de las llamadas al modelo: las de menor valor pasan primero
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+_priority: ContextVar[int] = ContextVar("llm_priority", default=PRIORITY_INTERACTIVE)
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+@contextmanager
+def llm_priority(priority: int) -> Iterator[None]:
+    """
+    Asigna una prioridad a las llamadas al modelo hechas dentro del bloque.
+
+    Example:
+        >>> with llm_priority(PRIORITY_BACKGROUND):
+        ...     structured_llm.batch(prompts)
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Convierte la duración de los encabezados de OpenAI a segundos.
+
+    Example:
+        >>> parse_duration("6m0s")
+        360.0
+        >>> parse_duration("20ms")
+        0.02
+    """
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return float(sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts))
+
+
+class TokenBucket:
+    """
+    Balde de fichas que se rellena de forma continua hasta la cuota por
+    minuto.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """
+        Segundos que faltan para poder retirar amount fichas.
+        """
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount: float):
+        self.level -= min(amount, self.capacity)
+
+    def limit(self, remaining: float, now: float):
+        """
+        Ajusta las fichas a lo que informa el servidor, que también cuenta
+        las solicitudes de otros procesos con la misma cuenta.
+        """
+        self._refill(now)
+        self.level = min(self.level, remaining)
+
+
+class RateLimitScheduler:
+    """
+    Planificador de las llamadas al modelo del proceso. Cada solicitud
+    espera su turno según su prioridad hasta que haya cuota de solicitudes
+    y de tokens por minuto, y todas se pausan cuando el servidor responde
+    que se superó el límite.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = LLM_TOKENS_PER_MINUTE,
+        max_backoff_seconds: float = LLM_MAX_BACKOFF_SECONDS,
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_backoff_seconds = max_backoff_seconds
+        self._paused_until = 0.0
+        self._rate_limited = 0
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def acquire(self, tokens: int, priority: int = PRIORITY_INTERACTIVE) -> float:
+        """
+        Espera hasta que la solicitud pueda enviarse y descuenta su cuota.
+
+        Args:
+            tokens (int): Tokens estimados de entrada y salida.
+            priority (int): Prioridad de la solicitud.
+        Returns:
+            float: Segundos de espera.
+        """
+        start = time.monotonic()
+        ticket = (priority, next(self._sequence))
+        with self._condition:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    timeout = None
+                    if self._waiting[0] == ticket:
+                        timeout = max(
+                            self._paused_until - now,
+                            self.requests.wait_time(1, now),
+                            self.tokens.wait_time(tokens, now),
+                        )
+                        if timeout <= 0:
+                            heapq.heappop(self._waiting)
+                            self.requests.take(1)
+                            self.tokens.take(tokens)
+                            self._condition.notify_all()
+                            return now - start
+                    self._condition.wait(timeout)
+            except BaseException:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                    self._condition.notify_all()
+                raise
+
+    def update(self, headers: Mapping[str, str]):
+        """
+        Ajusta la cuota restante según los encabezados x-ratelimit de
+        OpenAI.
+        """
+        now = time.monotonic()
+        with self._condition:
+            for bucket, name in ((self.requests, "requests"), (self.tokens, "tokens")):
+                remaining = headers.get(f"x-ratelimit-remaining-{name}")
+                if remaining is None:
+                    continue
+                bucket.limit(float(remaining), now)
+                # Sin cuota restante se espera a que el servidor la reponga
+                reset = parse_duration(headers.get(f"x-ratelimit-reset-{name}"))
+                if float(remaining) < 1 and reset:
+                    self._paused_until = max(self._paused_until, now + reset)
+
+    def succeeded(self):
+        with self._condition:
+            self._rate_limited = 0
+
+    def back_off(self, headers: Mapping[str, str]) -> float:
+        """
+        Pausa todas las solicitudes tras una respuesta 429. Usa la espera
+        indicada por el servidor o, si no la indica, una espera exponencial
+        con variación aleatoria.
+
+        Returns:
+            float: Segundos de pausa.
+        """
+        delay = None
+        if headers.get("retry-after-ms"):
+            delay = parse_duration(headers["retry-after-ms"] + "ms")
+        delay = delay or parse_duration(headers.get("retry-after"))
+        with self._condition:
+            self._rate_limited += 1
+            if delay is None:
+                delay = min(
+                    self.max_backoff_seconds, 2 ** (self._rate_limited - 1)
+                ) * random.uniform(0.5, 1.0)
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self._condition.notify_all()
+        return delay
+
+
+def estimate_request_tokens(request: httpx.Request) -> int:
+    """
+    Estima los tokens de entrada y salida de una solicitud a la API de chat.
+    """
+    try:
+        body = json.loads(request.content)
+    except (ValueError, UnicodeDecodeError):
+        return LLM_COMPLETION_TOKENS_ESTIMATE
+    prompt = json.dumps(
+        [body.get("messages", []), body.get("tools", [])], ensure_ascii=False
+    )
+    completion = (
+        body.get("max_completion_tokens")
+        or body.get("max_tokens")
+        or LLM_COMPLETION_TOKENS_ESTIMATE
+    )
+    return estimate_tokens(prompt) + completion
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+    """
+    Transporte HTTP que hace pasar cada solicitud por el planificador y
+    reintenta las rechazadas por límite de uso, en lugar de devolver el
+    error a la página.
+    """
+
+    def __init__(
+        self,
+        scheduler: RateLimitScheduler,
+        transport: httpx.BaseTransport,
+        max_retries: int = LLM_RATE_LIMIT_RETRIES,
+    ):
+        self.scheduler = scheduler
+        self.transport = transport
+        self.max_retries = max_retries
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        tokens = estimate_request_tokens(request)
+        priority = _priority.get()
+        for attempt in range(self.max_retries + 1):
+            waited = self.scheduler.acquire(tokens, priority)
+            if waited > 0.001:
+                record("rate_limit_wait", waited, priority=priority, tokens=tokens)
+            response = self.transport.handle_request(request)
+            self.scheduler.update(response.headers)
+            if response.status_code != 429:
+                self.scheduler.succeeded()
+                return response
+
+            # Sin saldo en la cuenta no sirve reintentar. Los 429 solo se
+            # reintentan aquí: el cliente de OpenAI, que reintenta por su
+            # cuenta los errores de conexión y del servidor, no vuelve a
+            # reintentar un 429 con este encabezado
+            response.read()
+            if attempt == self.max_retries or b"insufficient_quota" in response.content:
+                response.headers["x-should-retry"] = "false"
+                return response
+            response.close()
+            delay = self.scheduler.back_off(response.headers)
+            record("rate_limited", delay, attempt=attempt + 1)
+        return response
+
+    def close(self):
+        self.transport.close()
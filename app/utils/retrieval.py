@@ -0,0 +1,301 @@
+import math
+import re
+import unicodedata
+from typing import Collection, List, Tuple
+
+import numpy as np
+
+from utils.metrics import span
+
+# Parámetros por defecto para la selección de contexto. CONTEXT_TOP_K y los
+# presupuestos de tokens se pueden sobrescribir con variables de entorno o
+# en secrets.toml usando el mismo nombre, ver bibliography_input
+CHUNK_SIZE_WORDS = 180
+CHUNK_OVERLAP_WORDS = 30
+CONTEXT_TOP_K = 8
+CONTEXT_TOKEN_BUDGET = 6000
+# Parte del presupuesto que se usa en un resumen del documento que no
+# depende del pedido, para que el inicio del prompt sea siempre el mismo
+CONTEXT_STABLE_TOKEN_BUDGET = 3000
+# Palabras del inicio de un fragmento que se usan para indicar su ubicación
+FOCUS_HINT_WORDS = 25
+
+# Aproximación de caracteres por token para textos en español
+CHARS_PER_TOKEN = 4
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+_STOPWORDS = frozenset("""
+    a al algo como con de del desde donde el ella ellas ellos en entre era es
+    esta este esto estos fue ha hay la las le les lo los mas me mi muy no nos
+    o para pero por que se sin sobre son su sus tambien te tiene un una uno
+    unos unas y ya the of and to in is for on
+    """.split())
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estima la cantidad de tokens de un texto.
+
+    Args:
+        text (str): Texto a medir.
+    Returns:
+        int: Cantidad aproximada de tokens.
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Normaliza un texto y lo separa en términos para el índice léxico.
+    Se eliminan tildes, mayúsculas y palabras vacías.
+
+    Args:
+        text (str): Texto a tokenizar.
+    Returns:
+        List[str]: Lista de términos.
+
+    Example:
+        >>> tokenize("La Fotosíntesis de las plantas")
+        ['fotosintesis', 'plantas']
+    """
+    normalized = unicodedata.normalize("NFKD", text.lower())
+    normalized = "".join(c for c in normalized if not unicodedata.combining(c))
+    return [
+        word
+        for word in _WORD_PATTERN.findall(normalized)
+        if len(word) > 1 and word not in _STOPWORDS
+    ]
+
+
+def chunk_text(
+    text: str,
+    chunk_size: int = CHUNK_SIZE_WORDS,
+    overlap: int = CHUNK_OVERLAP_WORDS,
+) -> List[str]:
+    """
+    Divide un texto en fragmentos de tamaño similar con solapamiento.
+
+    Args:
+        text (str): Texto a dividir.
+        chunk_size (int): Cantidad de palabras por fragmento.
+        overlap (int): Palabras compartidas entre fragmentos consecutivos.
+    Returns:
+        List[str]: Fragmentos en el orden del documento.
+    """
+    words = text.split()
+    if not words:
+        return []
+    step = max(chunk_size - overlap, 1)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start : start + chunk_size]))
+        if start + chunk_size >= len(words):
+            break
+    return chunks
+
+
+class BM25Index:
+    """
+    Índice léxico BM25 en memoria sobre los fragmentos de un documento.
+    """
+
+    def __init__(self, text: str, k1: float = 1.5, b: float = 0.75):
+        self.text = text
+        self.chunks = chunks = chunk_text(text)
+        self.token_counts = np.array(
+            [estimate_tokens(chunk) for chunk in chunks], dtype=np.int64
+        )
+
+        # Postings (fragmento, término) guardados por columna, al estilo CSC,
+        # para no materializar una matriz densa fragmentos x vocabulario
+        vocabulary = {}
+        keys = []
+        for row, chunk in enumerate(chunks):
+            for term in tokenize(chunk):
+                column = vocabulary.setdefault(term, len(vocabulary))
+                keys.append(column * len(chunks) + row)
+        self.vocabulary = vocabulary
+
+        keys, frequencies = np.unique(
+            np.array(keys, dtype=np.int64), return_counts=True
+        )
+        self.rows = keys % max(len(chunks), 1)
+        columns = keys // max(len(chunks), 1)
+        self.column_pointers = np.searchsorted(columns, np.arange(len(vocabulary) + 1))
+
+        frequencies = frequencies.astype(np.float32)
+        lengths = np.bincount(self.rows, weights=frequencies, minlength=len(chunks))
+        average_length = lengths.mean() if len(chunks) else 0.0
+        document_frequency = np.diff(self.column_pointers)
+        idf = np.log(
+            1.0 + (len(chunks) - document_frequency + 0.5) / (document_frequency + 0.5)
+        )
+
+        norm = k1 * (1.0 - b + b * lengths / max(average_length, 1.0))
+        self.weights = (
+            frequencies * (k1 + 1.0) / (frequencies + norm[self.rows]) * idf[columns]
+        ).astype(np.float32)
+
+    def score(self, query: str) -> np.ndarray:
+        """
+        Calcula el puntaje BM25 de cada fragmento para una consulta.
+
+        Args:
+            query (str): Texto de la consulta.
+        Returns:
+            np.ndarray: Puntaje por fragmento.
+        """
+        columns = [
+            self.vocabulary[term] for term in tokenize(query) if term in self.vocabulary
+        ]
+        if not columns:
+            return np.zeros(len(self.chunks), dtype=np.float32)
+        postings = np.concatenate(
+            [
+                np.arange(
+                    self.column_pointers[column], self.column_pointers[column + 1]
+                )
+                for column in columns
+            ]
+        )
+        return np.bincount(
+            self.rows[postings],
+            weights=self.weights[postings],
+            minlength=len(self.chunks),
+        )
+
+
+def build_index(text: str) -> BM25Index:
+    """
+    Divide el texto extraído en fragmentos y construye su índice.
+
+    Args:
+        text (str): Texto completo del documento.
+    Returns:
+        BM25Index: Índice listo para consultar.
+    """
+    return BM25Index(text)
+
+
+def split_context(
+    index: BM25Index,
+    query: str,
+    top_k: int = CONTEXT_TOP_K,
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+    stable_budget: int = CONTEXT_STABLE_TOKEN_BUDGET,
+) -> Tuple[str, str]:
+    """
+    Divide el contexto de un pedido en una parte estable, que solo depende
+    del documento, y otra con los fragmentos más relevantes para la
+    consulta. Así la parte estable puede ir al inicio del prompt y el
+    proveedor la reutiliza desde su caché aunque cambie el pedido. Si el
+    documento completo cabe en el presupuesto, todo es parte estable.
+
+    Args:
+        index (BM25Index): Índice del documento.
+        query (str): Texto de la consulta.
+        top_k (int): Cantidad máxima de fragmentos relevantes.
+        token_budget (int): Tokens máximos de ambas partes juntas.
+        stable_budget (int): Tokens máximos de la parte estable.
+    Returns:
+        Tuple[str, str]: Fragmentos repartidos a lo largo del documento y
+            fragmentos relevantes para la consulta, cada uno en el orden
+            del documento.
+
+    Example:
+        >>> stable, relevant = split_context(index, "fotosíntesis")
+    """
+    if not index.chunks:
+        return "", ""
+    if estimate_tokens(index.text) <= token_budget:
+        return index.text, ""
+
+    with span("context_selection", chunks=len(index.chunks)):
+        stable = _spread_chunks(index, stable_budget)
+        used_tokens = int(sum(index.token_counts[position] for position in stable))
+        relevant = _select_chunks(
+            index, query, top_k, token_budget - used_tokens, exclude=set(stable)
+        )
+        return "\n\n".join(index.chunks[position] for position in stable), relevant
+
+
+def _spread_chunks(index: BM25Index, token_budget: int) -> List[int]:
+    # Fragmentos a intervalos regulares, desde el inicio hasta el final del
+    # documento, mientras quepan en el presupuesto
+    average_tokens = max(float(np.mean(index.token_counts)), 1.0)
+    count = min(len(index.chunks), max(1, int(token_budget // average_tokens)))
+    positions = sorted(set(np.linspace(0, len(index.chunks) - 1, count).astype(int)))
+    selected, used_tokens = [], 0
+    for position in positions:
+        if used_tokens + index.token_counts[position] > token_budget:
+            continue
+        selected.append(int(position))
+        used_tokens += int(index.token_counts[position])
+    return selected
+
+
+def _select_chunks(
+    index: BM25Index,
+    query: str,
+    top_k: int,
+    token_budget: int,
+    exclude: Collection[int] = (),
+):
+    scores = index.score(query)
+    # Ante empates se prefieren los fragmentos del inicio del documento
+    ranking = np.lexsort((np.arange(len(scores)), -scores))
+
+    selected, used_tokens = [], 0
+    for position in ranking:
+        if len(selected) == top_k:
+            break
+        if position in exclude:
+            continue
+        if used_tokens + index.token_counts[position] > token_budget:
+            continue
+        selected.append(position)
+        used_tokens += int(index.token_counts[position])
+
+    return "\n\n".join(index.chunks[position] for position in sorted(selected))
+
+
+def focus_hints(
+    index: BM25Index,
+    query: str,
+    count: int,
+    top_k: int = CONTEXT_TOP_K,
+    hint_words: int = FOCUS_HINT_WORDS,
+) -> List[str]:
+    """
+    Elige partes distintas del documento, entre las más relevantes para la
+    consulta, para repartir la generación de preguntas entre ellas. Cada
+    parte se identifica por las primeras palabras de su fragmento.
+
+    Args:
+        index (BM25Index): Índice del documento.
+        query (str): Texto de la consulta.
+        count (int): Cantidad de partes.
+        top_k (int): Fragmentos relevantes entre los que se elige.
+        hint_words (int): Palabras de cada indicación.
+    Returns:
+        List[str]: Hasta count indicaciones, en el orden del documento.
+
+    Example:
+        >>> focus_hints(index, "fotosíntesis", 3)
+        ['La fotosíntesis es el proceso…', 'La fase luminosa…', 'El ciclo de…']
+    """
+    if not index.chunks or count <= 0:
+        return []
+    scores = index.score(query)
+    ranking = np.lexsort((np.arange(len(scores)), -scores))
+    candidates = sorted(ranking[: max(top_k, count)])
+    # Fragmentos repartidos a lo largo de los candidatos, para que cada
+    # parte cubra una sección distinta
+    step = len(candidates) / min(count, len(candidates))
+    hints = []
+    for number in range(min(count, len(candidates))):
+        words = index.chunks[candidates[int(number * step)]].split()
+        hint = " ".join(words[:hint_words])
+        hints.append(hint + ("…" if len(words) > hint_words else ""))
+    return hints
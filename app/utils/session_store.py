@@ -0,0 +1,262 @@
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import streamlit as st
+from pydantic import BaseModel
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from utils.dedup import QuestionIndex
+from utils.llm_clients import get_setting
+from utils.metrics import record
+
+# Tiempo sin actividad tras el cual se liberan los datos de una sesión
+SESSION_IDLE_TTL_SECONDS = 2 * 60 * 60
+# Tiempo que se guardan los datos de una sesión cuyo navegador se
+# desconectó. Es el mismo plazo en que Streamlit permite reconectarse y
+# conserva st.session_state
+SESSION_DISCONNECTED_TTL_SECONDS = 2 * 60
+# Memoria máxima estimada de los datos de una sesión
+SESSION_MEMORY_LIMIT_BYTES = 8 * 1024 * 1024
+# Cada cuánto se buscan sesiones inactivas
+_EVICTION_INTERVAL_SECONDS = 60
+
+
+def estimate_size(obj: Any, seen: set = None) -> int:
+    """
+    Estima la memoria en bytes de un objeto y de todo lo que contiene.
+
+    Args:
+        obj (Any): Objeto a medir.
+    Returns:
+        int: Bytes aproximados.
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, np.ndarray):
+        return sys.getsizeof(obj) + (0 if obj.base is None else obj.nbytes)
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, int, float, bool)) or obj is None:
+        return size
+    if isinstance(obj, dict):
+        size += sum(
+            estimate_size(key, seen) + estimate_size(value, seen)
+            for key, value in obj.items()
+        )
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, seen) for item in obj)
+    elif isinstance(obj, BaseModel):
+        size += estimate_size(obj.__dict__, seen)
+    elif hasattr(obj, "__slots__"):
+        size += sum(
+            estimate_size(getattr(obj, name), seen)
+            for name in obj.__slots__
+            if hasattr(obj, name)
+        )
+    elif hasattr(obj, "__dict__"):
+        size += estimate_size(obj.__dict__, seen)
+    return size
+
+
+class SessionData:
+    """
+    Datos de trabajo de una sesión de la página de evaluaciones.
+    """
+
+    __slots__ = (
+        "questions_generated",
+        "questions_selected",
+        "question_index",
+        "editing_questions",
+        "last_seen",
+    )
+
+    def __init__(self):
+        # Las preguntas se guardan en diccionarios {ID: pregunta}, en orden
+        self.questions_generated: Dict[str, BaseModel] = {}
+        self.questions_selected: Dict[str, BaseModel] = {}
+        # Índice de las preguntas ya mostradas, para no repetirlas al regenerar
+        self.question_index = QuestionIndex()
+        # IDs de las preguntas que se están editando
+        self.editing_questions: set = set()
+        self.last_seen = time.time()
+
+    def memory_usage(self) -> int:
+        return estimate_size(self)
+
+    def shrink(self, limit_bytes: int) -> int:
+        """
+        Olvida las preguntas más antiguas del índice de duplicados hasta
+        quedar bajo el límite. Las preguntas generadas y las seleccionadas no
+        se tocan.
+
+        Returns:
+            int: Cantidad de preguntas que se olvidaron del índice.
+        """
+        before = len(self.question_index.texts)
+        while self.memory_usage() > limit_bytes and self.question_index.texts:
+            self.question_index.trim(len(self.question_index.texts) // 2)
+        return before - len(self.question_index.texts)
+
+
+class SessionStore:
+    """
+    Datos de todas las sesiones del proceso. Se eliminan las sesiones cuyo
+    navegador se desconectó, como lo hace Streamlit con st.session_state al
+    cerrar la pestaña, y las que no tienen actividad, para que la memoria no
+    crezca con cada profesor que deja la página abierta.
+    """
+
+    def __init__(
+        self,
+        idle_ttl_seconds: float = SESSION_IDLE_TTL_SECONDS,
+        memory_limit_bytes: int = SESSION_MEMORY_LIMIT_BYTES,
+        disconnected_ttl_seconds: float = SESSION_DISCONNECTED_TTL_SECONDS,
+        is_connected: Optional[Callable[[str], bool]] = None,
+    ):
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.memory_limit_bytes = memory_limit_bytes
+        self.disconnected_ttl_seconds = disconnected_ttl_seconds
+        # Indica si el navegador de una sesión sigue conectado. Sin esta
+        # función solo se eliminan las sesiones inactivas
+        self.is_connected = is_connected
+        self._sessions: Dict[str, SessionData] = {}
+        self._lock = threading.Lock()
+        self._last_eviction = time.time()
+
+    def get(self, session_id: str) -> SessionData:
+        """
+        Devuelve los datos de una sesión, creándolos si no existen.
+        """
+        now = time.time()
+        if now - self._last_eviction > _EVICTION_INTERVAL_SECONDS:
+            self.evict_idle(now)
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = SessionData()
+        session.last_seen = now
+        return session
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._sessions
+
+    def evict_idle(self, now: float = None) -> int:
+        """
+        Elimina las sesiones sin actividad durante más de idle_ttl_seconds y
+        las desconectadas durante más de disconnected_ttl_seconds.
+
+        Returns:
+            int: Cantidad de sesiones eliminadas.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._last_eviction = now
+            idle = [
+                session_id
+                for session_id, session in self._sessions.items()
+                if now - session.last_seen > self.idle_ttl_seconds
+                or (
+                    self.is_connected is not None
+                    and now - session.last_seen > self.disconnected_ttl_seconds
+                    and not self.is_connected(session_id)
+                )
+            ]
+            for session_id in idle:
+                del self._sessions[session_id]
+        if idle:
+            record("session_eviction", 0.0, sessions=len(idle))
+        return len(idle)
+
+    def enforce_limit(self, session: SessionData) -> int:
+        """
+        Reduce los datos de una sesión si superan el límite de memoria, ver
+        SessionData.shrink.
+
+        Returns:
+            int: Cantidad de preguntas que se olvidaron del índice de
+                duplicados.
+        """
+        return session.shrink(self.memory_limit_bytes)
+
+    def memory_report(self) -> List[Dict[str, Any]]:
+        """
+        Describe la memoria estimada y la inactividad de cada sesión.
+
+        Returns:
+            List[Dict[str, Any]]: Una fila por sesión, de mayor a menor uso.
+        """
+        now = time.time()
+        with self._lock:
+            sessions = list(self._sessions.items())
+        report = [
+            {
+                "sesión": session_id[:8],
+                "memoria (KB)": round(session.memory_usage() / 1024, 1),
+                "preguntas generadas": len(session.questions_generated),
+                "preguntas seleccionadas": len(session.questions_selected),
+                "inactiva (min)": round((now - session.last_seen) / 60, 1),
+            }
+            for session_id, session in sessions
+        ]
+        return sorted(report, key=lambda row: -row["memoria (KB)"])
+
+
+@st.cache_resource
+def get_session_store() -> SessionStore:
+    """
+    Devuelve el almacén de sesiones compartido por todas las páginas.
+    """
+    return SessionStore(
+        idle_ttl_seconds=get_setting(
+            "SESSION_IDLE_TTL_SECONDS", SESSION_IDLE_TTL_SECONDS
+        ),
+        memory_limit_bytes=get_setting(
+            "SESSION_MEMORY_LIMIT_BYTES", SESSION_MEMORY_LIMIT_BYTES
+        ),
+        disconnected_ttl_seconds=get_setting(
+            "SESSION_DISCONNECTED_TTL_SECONDS", SESSION_DISCONNECTED_TTL_SECONDS
+        ),
+        is_connected=_is_connected,
+    )
+
+
+def _is_connected(session_id: str) -> bool:
+    # Las sesiones usan el mismo ID que Streamlit, ver get_session_id
+    return not runtime.exists() or runtime.get_instance().is_active_session(session_id)
+
+
+def get_session_id() -> str:
+    """
+    Devuelve el ID de la sesión actual, creándolo si no existe. Es el mismo
+    ID que usa Streamlit para la conexión del navegador, así los datos se
+    liberan cuando se cierra la pestaña. En st.session_state solo se guarda
+    este ID.
+    """
+    if "session_id" not in st.session_state:
+        ctx = get_script_run_ctx()
+        st.session_state.session_id = ctx.session_id if ctx else uuid.uuid4().hex
+    return st.session_state.session_id
+
+
+def get_session() -> SessionData:
+    """
+    Devuelve los datos de la sesión actual.
+
+    Example:
+        >>> session = get_session()
+        >>> session.questions_selected
+        {}
+    """
+    store = get_session_store()
+    if "session_id" in st.session_state and st.session_state.session_id not in store:
+        st.toast("Tu sesión estuvo inactiva por mucho tiempo y se reinició.")
+    return store.get(get_session_id())
@@ -0,0 +1,32 @@
+import os
+import sqlite3
+import tempfile
+
+# Directorio compartido por todas las réplicas del servidor en un mismo host
+CACHE_DIR = os.environ.get(
+    "AYUDA_A_TU_PROFE_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "ayuda_a_tu_profe"),
+)
+# Directorio de los datos que deben conservarse, como el banco de preguntas
+DATA_DIR = os.environ.get(
+    "AYUDA_A_TU_PROFE_DATA_DIR",
+    os.path.join(os.path.expanduser("~"), ".ayuda_a_tu_profe"),
+)
+
+
+def connect(filename: str, directory: str = CACHE_DIR) -> sqlite3.Connection:
+    """
+    Abre una conexión a una base SQLite, por defecto dentro de CACHE_DIR,
+    configurada para que varios procesos puedan leer y escribir a la vez.
+
+    Args:
+        filename (str): Nombre del archivo de la base de datos.
+        directory (str): Directorio donde se guarda la base de datos.
+    Returns:
+        sqlite3.Connection: Conexión abierta.
+    """
+    os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(os.path.join(directory, filename), timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
@@ -0,0 +1,118 @@
+import re
+import time
+import zlib
+from typing import Any, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+_QUANTITY_PATTERN = re.compile(r"Crea (\d+) preguntas")
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Modelo de chat determinista para ejecutar las páginas sin conexión.
+
+    Responde a las llamadas con salida estructurada con objetos que cumplen
+    el esquema pedido (preguntas, referencias o verificaciones) y al resto
+    con una planificación en Markdown. `delay` simula la latencia de red.
+    """
+
+    delay: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def bind_tools(self, tools, **kwargs: Any):
+        return self.bind(
+            tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs
+        )
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.delay:
+            time.sleep(self.delay)
+        tools = kwargs.get("tools") or []
+        if not tools:
+            content = "\n\n".join(
+                f"## Semana {week}\n\n- Tema {week}" for week in range(1, 16)
+            )
+            return ChatResult(
+                generations=[ChatGeneration(message=AIMessage(content=content))]
+            )
+
+        name = tools[0]["function"]["name"]
+        match = _QUANTITY_PATTERN.search(messages[-1].content)
+        quantity = int(match.group(1)) if match else 5
+        # Cada prompt distinto, como las partes de un pedido repartido, recibe
+        # preguntas numeradas desde otro valor para que no sean duplicadas
+        first = zlib.crc32(messages[-1].content.encode()) % 10000 * 100
+        tool_call = {
+            "name": name,
+            "args": _fake_arguments(name, quantity, first),
+            "id": "0",
+        }
+        return ChatResult(
+            generations=[
+                ChatGeneration(message=AIMessage(content="", tool_calls=[tool_call]))
+            ]
+        )
+
+
+def _label(number: int) -> str:
+    # Número seguido de dos palabras propias, para que las preguntas falsas
+    # no parezcan duplicadas entre sí
+    digest = f"{zlib.crc32(str(number).encode()):08x}"
+    return f"{number} ({digest[:4]} {digest[4:]})"
+
+
+def _fake_arguments(name: str, quantity: int, first: int = 0) -> dict:
+    if name == "MultipleChoiceQuestionList":
+        return {
+            "questions_answers": [
+                {
+                    "pregunta": f"Pregunta de alternativas {_label(first + i)}",
+                    "respuesta": "Opción 1",
+                    "alternativas": [f"Opción {j}" for j in range(1, 6)],
+                }
+                for i in range(quantity)
+            ]
+        }
+    if name == "DevelopmentQuestionList":
+        return {
+            "questions_answers": [
+                {
+                    "pregunta": f"Pregunta de desarrollo {_label(first + i)}",
+                    "respuesta": "Respuesta",
+                }
+                for i in range(quantity)
+            ]
+        }
+    if name == "TrueFalseQuestionList":
+        return {
+            "questions_answers": [
+                {
+                    "pregunta": f"Afirmación {_label(first + i)}",
+                    "respuesta": "Verdadero",
+                }
+                for i in range(quantity)
+            ]
+        }
+    if name == "ListaReferencias":
+        return {
+            "referencias": [
+                {"titulo": f"Libro {i}", "autores": "Autor", "anio": "2020"}
+                for i in range(5)
+            ]
+        }
+    if name == "ExistenciaReferencia":
+        return {"existe": True}
+    raise ValueError(f"Esquema no soportado por el modelo falso: {name}")
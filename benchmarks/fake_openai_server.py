@@ -0,0 +1,266 @@
+"""
+Servidor local que imita la API de chat de OpenAI, con límites de uso.
+
+Uso:
+    python benchmarks/fake_openai_server.py --port 8765 --requests 60 --window 60
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 streamlit run app/Ayuda_a_tu_profe!.py
+
+Responde con el modelo falso de fake_llm.py y, al superar la cantidad de
+solicitudes o tokens permitidos en la ventana, responde 429 con los mismos
+encabezados x-ratelimit y retry-after que OpenAI. También informa como
+cached_tokens los mensajes de sistema largos que ya recibió, como el caché
+de prompts de OpenAI. Sirve para probar el planificador de llamadas y el
+orden de los prompts sin gastar cuota real.
+"""
+
+import argparse
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fake_llm import FakeChatModel
+from langchain_core.messages import HumanMessage
+
+CHARS_PER_TOKEN = 4
+# Como OpenAI, solo se guardan en caché los prefijos de al menos 1024 tokens,
+# en bloques de 128
+PROMPT_CACHE_MIN_TOKENS = 1024
+PROMPT_CACHE_BLOCK_TOKENS = 128
+
+
+class RateLimitWindow:
+    """
+    Solicitudes y tokens aceptados en la ventana de tiempo actual.
+    """
+
+    def __init__(self, max_requests: int, max_tokens: int, window_seconds: float):
+        self.max_requests = max_requests
+        self.max_tokens = max_tokens
+        self.window_seconds = window_seconds
+        self.accepted = deque()
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def try_accept(self, tokens: int) -> dict:
+        """
+        Registra la solicitud si cabe en la ventana.
+
+        Returns:
+            dict: Encabezados de límite de uso, con retry-after-ms si se
+                rechaza la solicitud.
+        """
+        now = time.monotonic()
+        with self._lock:
+            while self.accepted and now - self.accepted[0][0] > self.window_seconds:
+                self.accepted.popleft()
+            used_tokens = sum(amount for _, amount in self.accepted)
+            reset = (
+                self.window_seconds - (now - self.accepted[0][0])
+                if self.accepted
+                else 0.0
+            )
+            accepted = (
+                len(self.accepted) < self.max_requests
+                and used_tokens + tokens <= self.max_tokens
+            )
+            if accepted:
+                self.accepted.append((now, tokens))
+                used_tokens += tokens
+            else:
+                self.rejected += 1
+            headers = {
+                "x-ratelimit-limit-requests": str(self.max_requests),
+                "x-ratelimit-remaining-requests": str(
+                    self.max_requests - len(self.accepted)
+                ),
+                "x-ratelimit-reset-requests": f"{reset:.3f}s",
+                "x-ratelimit-limit-tokens": str(self.max_tokens),
+                "x-ratelimit-remaining-tokens": str(
+                    max(0, self.max_tokens - used_tokens)
+                ),
+                "x-ratelimit-reset-tokens": f"{reset:.3f}s",
+            }
+            if not accepted:
+                headers["retry-after-ms"] = str(int(reset * 1000) + 1)
+            return headers
+
+
+def make_handler(window: RateLimitWindow, model: FakeChatModel):
+    # Mensajes de sistema ya vistos, para simular el caché de prompts
+    seen_prefixes = set()
+
+    def cached_tokens(messages: list) -> int:
+        if not messages or not isinstance(messages[0].get("content"), str):
+            return 0
+        prefix = messages[0]["content"]
+        tokens = len(prefix) // CHARS_PER_TOKEN
+        if tokens < PROMPT_CACHE_MIN_TOKENS:
+            return 0
+        if prefix not in seen_prefixes:
+            seen_prefixes.add(prefix)
+            return 0
+        return tokens - tokens % PROMPT_CACHE_BLOCK_TOKENS
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status: int, body: dict, headers: dict):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            prompt = "".join(
+                message["content"]
+                for message in body.get("messages", [])
+                if isinstance(message.get("content"), str)
+            )
+            prompt_tokens = len(prompt) // CHARS_PER_TOKEN
+            headers = window.try_accept(prompt_tokens)
+            if "retry-after-ms" in headers:
+                self._send_json(
+                    429,
+                    {
+                        "error": {
+                            "message": "Rate limit reached",
+                            "type": "requests",
+                            "code": "rate_limit_exceeded",
+                        }
+                    },
+                    headers,
+                )
+                return
+
+            result = model._generate(
+                [HumanMessage(content=prompt)], tools=body.get("tools")
+            )
+            message = result.generations[0].message
+            completion_tokens = len(json.dumps(message.tool_calls)) // CHARS_PER_TOKEN
+            completion_tokens += len(message.content) // CHARS_PER_TOKEN
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {
+                    "cached_tokens": cached_tokens(body.get("messages", []))
+                },
+            }
+            reply = {"role": "assistant", "content": message.content or None}
+            if message.tool_calls:
+                reply["tool_calls"] = [
+                    {
+                        "id": f"call_{index}",
+                        "type": "function",
+                        "function": {
+                            "name": call["name"],
+                            "arguments": json.dumps(call["args"]),
+                        },
+                    }
+                    for index, call in enumerate(message.tool_calls)
+                ]
+
+            if not body.get("stream"):
+                self._send_json(
+                    200,
+                    {
+                        "id": "chatcmpl-fake",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": body.get("model", "fake"),
+                        "choices": [
+                            {"index": 0, "message": reply, "finish_reason": "stop"}
+                        ],
+                        "usage": usage,
+                    },
+                    headers,
+                )
+                return
+
+            # Respuesta en streaming: el texto en un fragmento y el uso al final
+            chunks = [
+                {"choices": [{"index": 0, "delta": reply, "finish_reason": None}]},
+                {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]},
+            ]
+            if (body.get("stream_options") or {}).get("include_usage"):
+                chunks.append({"choices": [], "usage": usage})
+            data = b"".join(
+                b"data: "
+                + json.dumps(
+                    {
+                        "id": "chatcmpl-fake",
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": body.get("model", "fake"),
+                        **chunk,
+                    }
+                ).encode()
+                + b"\n\n"
+                for chunk in chunks
+            )
+            data += b"data: [DONE]\n\n"
+            self.send_response(200)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+def start_server(
+    port: int = 0,
+    max_requests: int = 60,
+    max_tokens: int = 1_000_000,
+    window_seconds: float = 60.0,
+    delay: float = 0.0,
+):
+    """
+    Inicia el servidor en un hilo. Con port=0 se elige un puerto libre.
+
+    Returns:
+        Tuple[ThreadingHTTPServer, RateLimitWindow]: Servidor y ventana de
+            límites, para consultar las solicitudes rechazadas.
+    """
+    window = RateLimitWindow(max_requests, max_tokens, window_seconds)
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", port), make_handler(window, FakeChatModel(delay=delay))
+    )
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, window
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--tokens", type=int, default=1_000_000)
+    parser.add_argument("--window", type=float, default=60.0)
+    parser.add_argument("--delay", type=float, default=0.5)
+    args = parser.parse_args()
+
+    server, _ = start_server(
+        args.port, args.requests, args.tokens, args.window, args.delay
+    )
+    print(f"Escuchando en http://127.0.0.1:{server.server_address[1]}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+"""
+Benchmarks de las rutas críticas de la aplicación, sin acceso a la red.
+
+Uso:
+    python benchmarks/run_benchmarks.py --output benchmarks/results.json
+
+Mide la extracción de texto de PDFs, la generación del Markdown y del PDF
+de las pruebas y ejecuciones completas de las páginas con AppTest de
+Streamlit, reemplazando ChatOpenAI por un modelo falso determinista. El
+planificador de llamadas se mide contra un servidor local que imita los
+límites de uso de OpenAI.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from io import BytesIO
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+APP_DIR = ROOT / "app"
+
+# Los cachés en disco se aíslan en un directorio temporal antes de importar
+# los módulos de la aplicación
+os.environ["AYUDA_A_TU_PROFE_CACHE_DIR"] = tempfile.mkdtemp(prefix="bench-cache-")
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+sys.path.insert(0, str(APP_DIR))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from fake_llm import FakeChatModel  # noqa: E402
+from fake_openai_server import start_server  # noqa: E402
+from models.question import (  # noqa: E402
+    DevelopmentQuestion,
+    MultipleChoiceQuestion,
+    TrueFalseQuestion,
+)
+from utils import llm_clients  # noqa: E402
+from utils.jobs import get_job_queue  # noqa: E402
+from utils.pdf_utils import (  # noqa: E402
+    convert_test_to_pdf,
+    extract_text_from_pdf,
+    generate_test_markdown,
+)
+from utils.question_generation import generate_questions  # noqa: E402
+from utils.rate_limit import RateLimitedTransport, RateLimitScheduler  # noqa: E402
+from utils.session_store import get_session_store  # noqa: E402
+from xhtml2pdf import pisa  # noqa: E402
+
+PAGES = {
+    "curriculum": APP_DIR / "pages" / "0_Actualización_Curricular.py",
+    "evaluation": APP_DIR / "pages" / "1_Crea_tu_evaluación.py",
+    "bibliography": APP_DIR / "pages" / "2_Buscar_Bibliografía.py",
+}
+
+
+def measure(function, repeat: int) -> dict:
+    """
+    Ejecuta una función varias veces y resume los tiempos en segundos.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {
+        "repeat": repeat,
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.fmean(timings),
+        "max": max(timings),
+    }
+
+
+def make_pdf(pages: int) -> bytes:
+    """
+    Genera un PDF sintético con el número de páginas pedido.
+    """
+    body = "".join(
+        f"<h1>Clase {page}</h1>"
+        + "<p>La fotosíntesis transforma la energía lumínica en energía química. " * 20
+        + "</p><pdf:nextpage />"
+        for page in range(pages)
+    )
+    output = BytesIO()
+    pisa.CreatePDF(f"<html><body>{body}</body></html>", dest=output)
+    return output.getvalue()
+
+
+def make_questions(quantity: int) -> list:
+    """
+    Genera una prueba sintética que mezcla los tres tipos de pregunta.
+    """
+    questions = []
+    for i in range(quantity):
+        if i % 3 == 0:
+            questions.append(
+                MultipleChoiceQuestion(
+                    pregunta=f"¿Cuál es la alternativa correcta {i}?",
+                    respuesta="Opción A",
+                    alternativas=["Opción A", "Opción B", "Opción C", "Opción D"],
+                )
+            )
+        elif i % 3 == 1:
+            questions.append(
+                DevelopmentQuestion(
+                    pregunta=f"Explica el proceso número {i}", respuesta="Porque..."
+                )
+            )
+        else:
+            questions.append(
+                TrueFalseQuestion(
+                    pregunta=f"La afirmación {i} es cierta", respuesta="Falso"
+                )
+            )
+    return questions
+
+
+def make_question_ids(prefix: str, quantity: int) -> dict:
+    """
+    Genera preguntas sintéticas con IDs fijos, como las guarda la página.
+    """
+    return {
+        f"{prefix}_{i}": question for i, question in enumerate(make_questions(quantity))
+    }
+
+
+def bench_extraction(sizes, repeat: int) -> dict:
+    results = {}
+    for pages in sizes:
+        pdf_bytes = make_pdf(pages)
+
+        def cold():
+            # Un byte extra cambia el hash y evita los cachés
+            cold.calls += 1
+            extract_text_from_pdf.clear()
+            extract_text_from_pdf(BytesIO(pdf_bytes + b"\n%" * cold.calls))
+
+        cold.calls = 0
+
+        def disk_cache():
+            extract_text_from_pdf.clear()
+            extract_text_from_pdf(BytesIO(pdf_bytes))
+
+        disk_cache()
+        results[f"{pages}_pages"] = {
+            "cold": measure(cold, repeat),
+            "disk_cache": measure(disk_cache, repeat),
+        }
+    return results
+
+
+def bench_rendering(sizes, repeat: int) -> dict:
+    results = {}
+    for quantity in sizes:
+        questions = make_questions(quantity)
+        results[f"{quantity}_questions"] = {
+            "generate_test_markdown": measure(
+                lambda: generate_test_markdown(questions, "Biología"), repeat
+            ),
+            "convert_test_to_pdf": measure(
+                lambda: convert_test_to_pdf(questions, "Biología"), repeat
+            ),
+        }
+    return results
+
+
+def bench_generation(sizes, repeat: int) -> dict:
+    llm = FakeChatModel()
+    prompt_input = {
+        "bibliography": "La fotosíntesis transforma la energía. " * 500,
+        "sample_questions": "",
+        "difficulty": "Intermedio",
+        "topic": "Biología",
+    }
+    return {
+        f"{quantity}_questions": measure(
+            lambda: generate_questions(
+                llm, "Alternativas", {**prompt_input, "question_quantity": quantity}
+            ),
+            repeat,
+        )
+        for quantity in sizes
+    }
+
+
+def bench_pages(question_count: int, repeat: int) -> dict:
+    from streamlit.testing.v1 import AppTest
+
+    fake_llm = FakeChatModel()
+    llm_clients.get_chat_model = lambda *args, **kwargs: fake_llm
+
+    def new_app(page: str) -> AppTest:
+        app = AppTest.from_file(str(PAGES[page]), default_timeout=300)
+        app.secrets["OPENAI_API_KEY"] = "sk-benchmark"
+        return app
+
+    def evaluation_app() -> AppTest:
+        app = new_app("evaluation")
+        app.session_state["session_id"] = "benchmark"
+        session = get_session_store().get("benchmark")
+        session.questions_generated = make_question_ids("generated", question_count)
+        session.questions_selected = make_question_ids("selected", question_count)
+        app.run()
+        return app
+
+    results = {
+        "curriculum_first_run": measure(lambda: new_app("curriculum").run(), repeat),
+        "evaluation_first_run": measure(evaluation_app, repeat),
+    }
+
+    app = evaluation_app()
+    results["evaluation_edit_click"] = measure(
+        lambda: app.button(key="edit_selected_0").click().run(), repeat
+    )
+
+    # Cada clic mueve una pregunta distinta, porque la anterior ya no está
+    # entre las generadas
+    clicks = iter(range(question_count))
+
+    def select_click():
+        app.button(key=f"select_generated_{next(clicks)}").click().run()
+
+    results["evaluation_select_click"] = measure(select_click, repeat)
+
+    def bibliography_search():
+        app = new_app("bibliography")
+        app.run()
+        app.text_input[0].input("Probabilidades avanzadas")
+        app.button[0].click().run()
+        # La búsqueda corre en segundo plano: se espera su resultado y se
+        # vuelve a ejecutar la página para mostrarlo
+        get_job_queue().get(app.session_state["bibliography_job"]).future.result()
+        app.run()
+
+    results["bibliography_search"] = measure(bibliography_search, repeat)
+    results["questions_on_screen"] = question_count
+    return results
+
+
+def bench_rate_limit(request_count: int) -> dict:
+    """
+    Envía solicitudes en paralelo a un servidor local con un límite de 10
+    solicitudes cada 2 segundos, más bajo que la cuota configurada, para
+    medir cuántas fallan y el rendimiento sostenido.
+    """
+    import httpx
+    from langchain_openai import ChatOpenAI
+
+    server, window = start_server(max_requests=10, window_seconds=2.0)
+    llm = ChatOpenAI(
+        api_key="sk-benchmark",
+        base_url=f"http://127.0.0.1:{server.server_address[1]}/v1",
+        max_retries=0,
+        http_client=httpx.Client(
+            transport=RateLimitedTransport(
+                RateLimitScheduler(requests_per_minute=6000), httpx.HTTPTransport()
+            )
+        ),
+    )
+    start = time.perf_counter()
+    try:
+        responses = llm.batch(
+            [f"Solicitud {i}" for i in range(request_count)],
+            config={"max_concurrency": 8},
+            return_exceptions=True,
+        )
+    finally:
+        server.shutdown()
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": request_count,
+        "failed": sum(isinstance(response, Exception) for response in responses),
+        "rate_limited_responses": window.rejected,
+        "seconds": elapsed,
+        "requests_per_second": request_count / elapsed,
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--output",
+        default=str(ROOT / "benchmarks" / "results.json"),
+        help="Archivo JSON donde se guardan los resultados.",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--quick",
+        action="store_true",
+        help="Usa tamaños pequeños para una prueba rápida.",
+    )
+    args = parser.parse_args()
+
+    pdf_sizes = [10, 50] if args.quick else [10, 100, 500]
+    exam_sizes = [10, 50] if args.quick else [10, 100, 500]
+
+    results = {
+        "metadata": {
+            "revision": git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "extract_text_from_pdf": bench_extraction(pdf_sizes, args.repeat),
+        "rendering": bench_rendering(exam_sizes, args.repeat),
+        "generate_questions": bench_generation(exam_sizes, args.repeat),
+        "pages": bench_pages(40, args.repeat),
+        "rate_limit": bench_rate_limit(20 if args.quick else 60),
+    }
+
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as output:
+        json.dump(results, output, indent=2, ensure_ascii=False)
+    print(f"Resultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()